@@ -14,6 +14,8 @@ CONTAINER_PREFERENCE = ['podman', 'docker']  # prefer podman to docker
 CUSTOM_PS1 = r'[ceph: \u@\h \W]\$ '
 DEFAULT_TIMEOUT = None  # in seconds
 DEFAULT_RETRY = 10
+CALL_READ_SIZE = 65536  # bytes read from a command's pipes at a time
+ASYNC_CALL_LIMIT = 16  # commands async_call() runs at once per event loop
 SHELL_DEFAULT_CONF = '/etc/ceph/ceph.conf'
 SHELL_DEFAULT_KEYRING = '/etc/ceph/ceph.client.admin.keyring'
 
@@ -38,6 +40,8 @@ You can invoke cephadm in two ways:
        injected_stdin = '...'
 """
 import argparse
+import asyncio
+import codecs
 import datetime
 import fcntl
 import ipaddress
@@ -49,7 +53,7 @@ import platform
 import pwd
 import random
 import re
-import select
+import selectors
 import shutil
 import socket
 import string
@@ -57,6 +61,7 @@ import subprocess
 import sys
 import tempfile
 import time
+import weakref
 import errno
 import struct
 from socketserver import ThreadingMixIn
@@ -68,7 +73,7 @@ import ssl
 
 
 try:
-    from typing import Dict, List, Tuple, Optional, Union, Any, NoReturn, Callable, IO
+    from typing import Dict, List, Tuple, Optional, Union, Any, NoReturn, Callable, IO, Iterator, Awaitable
 except ImportError:
     pass
 
@@ -969,12 +974,150 @@ class FileLock(object):
 ##################################
 # Popen wrappers, lifted from ceph-volume
 
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+
+class _LineSplitter:
+    """
+    Turn the raw chunks read from a pipe into complete lines.
+
+    Decoding is incremental, so a multibyte character split across two reads
+    survives, and a partial line is kept as a list of pieces so a long line
+    arriving in many chunks is only joined once.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._partial = []  # type: List[str]
+
+    def feed(self, data, final=False):
+        # type: (bytes, bool) -> List[str]
+        pieces = self._decoder.decode(data, final).split('\n')
+        tail = pieces.pop()
+        lines = []  # type: List[str]
+        if pieces:
+            pieces[0] = ''.join(self._partial) + pieces[0]
+            self._partial = []
+            lines = [piece + '\n' for piece in pieces]
+        if tail:
+            self._partial.append(tail)
+        if final and self._partial:
+            lines.append(''.join(self._partial))
+            self._partial = []
+        return lines
+
+
+class CallStream:
+    """
+    Run a command and iterate over its output as it arrives.
+
+    Yields (STDOUT | STDERR, line) tuples, each line keeping its trailing
+    newline so that joining them gives back the exact output.  Nothing is
+    buffered beyond the current line, which lets callers parse huge outputs
+    on the fly.  `returncode` is set once the iteration is over; breaking out
+    of it early kills the command.
+    """
+
+    def __init__(self,
+                 ctx,  # type: CephadmContext
+                 command,  # type: List[str]
+                 desc=None,  # type: Optional[str]
+                 timeout=DEFAULT_TIMEOUT,  # type: Optional[int]
+                 **kwargs):
+        # type: (...) -> None
+        if desc is None:
+            desc = command[0]
+        if desc:
+            desc += ': '
+        self.command = command
+        self.desc = desc
+        self.timeout = timeout or ctx.args.timeout
+        self.kwargs = kwargs
+        self.returncode = None  # type: Optional[int]
+
+    def __iter__(self):
+        # type: () -> Iterator[Tuple[str, str]]
+        logger.debug('Running command: %s' % ' '.join(self.command))
+        process = subprocess.Popen(
+            self.command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            close_fds=True,
+            **self.kwargs
+        )
+        assert process.stdout is not None
+        assert process.stderr is not None
+        sel = selectors.DefaultSelector()
+        for stream, pipe in ((STDOUT, process.stdout), (STDERR, process.stderr)):
+            os.set_blocking(pipe.fileno(), False)
+            sel.register(pipe, selectors.EVENT_READ, (stream, _LineSplitter()))
+
+        end_time = None
+        if self.timeout:
+            end_time = time.time() + self.timeout
+        done = False
+        stop = False
+        try:
+            while sel.get_map() and not stop:
+                if end_time and time.time() >= end_time:
+                    if process.poll() is None:
+                        logger.info(self.desc + 'timeout after %s seconds'
+                                    % self.timeout)
+                        process.kill()
+                    stop = True
+                else:
+                    wait = None
+                    if end_time:
+                        wait = max(end_time - time.time(), 0)
+                    ready = [key for key, _ in sel.select(wait)]
+                    # once the command is gone, read off whatever is left
+                    # in the pipes instead of waiting for an EOF that a
+                    # lingering child may hold back
+                    stop = process.poll() is not None
+                if stop:
+                    ready = list(sel.get_map().values())
+                for key in ready:
+                    stream, splitter = key.data
+                    while True:
+                        try:
+                            data = os.read(key.fd, CALL_READ_SIZE)
+                        except BlockingIOError:
+                            break
+                        except OSError:
+                            data = b''
+                        if not data:
+                            sel.unregister(key.fileobj)
+                            for line in splitter.feed(b'', final=True):
+                                yield stream, line
+                            break
+                        for line in splitter.feed(data):
+                            yield stream, line
+                        if not stop:
+                            break
+            for key in list(sel.get_map().values()):
+                stream, splitter = key.data
+                for line in splitter.feed(b'', final=True):
+                    yield stream, line
+            done = True
+        finally:
+            sel.close()
+            if not done and process.poll() is None:
+                process.kill()
+            self.returncode = process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+
 def call(ctx, # type: CephadmContext
          command,  # type: List[str]
          desc=None,  # type: Optional[str]
          verbose=False,  # type: bool
          verbose_on_failure=True,  # type: bool
          timeout=DEFAULT_TIMEOUT,  # type: Optional[int]
+         on_line=None,  # type: Optional[Callable[[str, str], None]]
+         keep_output=True,  # type: bool
          **kwargs):
     """
     Wrap subprocess.Popen to
@@ -988,121 +1131,53 @@ def call(ctx, # type: CephadmContext
     :param verbose_on_failure: On a non-zero exit status, it will forcefully set
                                logging ON for the terminal
     :param timeout: timeout in seconds
+    :param on_line: called with (STDOUT | STDERR, line) for every line of
+                    output as it arrives
+    :param keep_output: set to False along with on_line to stream a large
+                        output without holding it; out and err are then empty
     """
 
-    if desc is None:
-        desc = command[0]
-    if desc:
-        desc += ': '
-    timeout = timeout or ctx.args.timeout
-
-    logger.debug("Running command: %s" % ' '.join(command))
-    process = subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        close_fds=True,
-        **kwargs
-    )
-    # get current p.stdout flags, add O_NONBLOCK
-    assert process.stdout is not None
-    assert process.stderr is not None
-    stdout_flags = fcntl.fcntl(process.stdout, fcntl.F_GETFL)
-    stderr_flags = fcntl.fcntl(process.stderr, fcntl.F_GETFL)
-    fcntl.fcntl(process.stdout, fcntl.F_SETFL, stdout_flags | os.O_NONBLOCK)
-    fcntl.fcntl(process.stderr, fcntl.F_SETFL, stderr_flags | os.O_NONBLOCK)
-
-    out = ''
-    err = ''
-    reads = None
-    stop = False
-    out_buffer = ''   # partial line (no newline yet)
-    err_buffer = ''   # partial line (no newline yet)
+    stream = CallStream(ctx, command, desc=desc, timeout=timeout, **kwargs)
+    desc = stream.desc
+    level = logging.INFO if verbose else logging.DEBUG
+    log_lines = logger.isEnabledFor(level)
     start_time = time.time()
-    end_time = None
-    if timeout:
-        end_time = start_time + timeout
-    while not stop:
-        if end_time and (time.time() >= end_time):
-            stop = True
-            if process.poll() is None:
-                logger.info(desc + 'timeout after %s seconds' % timeout)
-                process.kill()
-        if reads and process.poll() is not None:
-            # we want to stop, but first read off anything remaining
-            # on stdout/stderr
-            stop = True
-        else:
-            reads, _, _ = select.select(
-                [process.stdout.fileno(), process.stderr.fileno()],
-                [], [], timeout
-            )
-        for fd in reads:
-            try:
-                message = str()
-                message_b = os.read(fd, 1024)
-                if isinstance(message_b, bytes):
-                    message = message_b.decode('utf-8')
-                if isinstance(message_b, str):
-                    message = message_b
-                if stop and message:
-                    # process has terminated, but have more to read still, so not stopping yet
-                    # (os.read returns '' when it encounters EOF)
-                    stop = False
-                if not message:
-                    continue
-                if fd == process.stdout.fileno():
-                    out += message
-                    message = out_buffer + message
-                    lines = message.split('\n')
-                    out_buffer = lines.pop()
-                    for line in lines:
-                        if verbose:
-                            logger.info(desc + 'stdout ' + line)
-                        else:
-                            logger.debug(desc + 'stdout ' + line)
-                elif fd == process.stderr.fileno():
-                    err += message
-                    message = err_buffer + message
-                    lines = message.split('\n')
-                    err_buffer = lines.pop()
-                    for line in lines:
-                        if verbose:
-                            logger.info(desc + 'stderr ' + line)
-                        else:
-                            logger.debug(desc + 'stderr ' + line)
-                else:
-                    assert False
-            except (IOError, OSError):
-                pass
-        if verbose:
-            logger.debug(desc + 'profile rt=%s, stop=%s, exit=%s, reads=%s'
-                % (time.time()-start_time, stop, process.poll(), reads))
 
-    returncode = process.wait()
-
-    if out_buffer != '':
-        if verbose:
-            logger.info(desc + 'stdout ' + out_buffer)
-        else:
-            logger.debug(desc + 'stdout ' + out_buffer)
-    if err_buffer != '':
-        if verbose:
-            logger.info(desc + 'stderr ' + err_buffer)
-        else:
-            logger.debug(desc + 'stderr ' + err_buffer)
+    output = {STDOUT: [], STDERR: []}  # type: Dict[str, List[str]]
+    for name, line in stream:
+        if keep_output:
+            output[name].append(line)
+        if on_line:
+            on_line(name, line)
+        if log_lines:
+            logger.log(level, desc + name + ' ' + line.rstrip('\n'))
+
+    returncode = stream.returncode
+    assert returncode is not None
+    out = ''.join(output[STDOUT])
+    err = ''.join(output[STDERR])
+    if verbose:
+        logger.debug(desc + 'profile rt=%s, exit=%s'
+            % (time.time()-start_time, returncode))
 
     if returncode != 0 and verbose_on_failure and not verbose:
         # dump stdout + stderr
         logger.info('Non-zero exit code %d from %s' % (returncode, ' '.join(command)))
-        for line in out.splitlines():
-            logger.info(desc + 'stdout ' + line)
-        for line in err.splitlines():
-            logger.info(desc + 'stderr ' + line)
+        _log_output(desc, logging.INFO, out, err)
 
     return out, err, returncode
 
 
+def _log_output(desc, level, out, err):
+    # type: (str, int, str, str) -> None
+    if not logger.isEnabledFor(level):
+        return
+    for line in out.splitlines():
+        logger.log(level, desc + 'stdout ' + line)
+    for line in err.splitlines():
+        logger.log(level, desc + 'stderr ' + line)
+
+
 def call_throws(ctx, command, **kwargs):
     # type: (CephadmContext, List[str], Any) -> Tuple[str, str, int]
     out, err, ret = call(ctx, command, **kwargs)
@@ -1149,6 +1224,160 @@ def call_timeout(ctx, command, timeout):
         ret = call_timeout_py2(command, timeout)
     return ret
 
+
+_call_limits = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+
+def _call_limit():
+    # type: () -> asyncio.Semaphore
+    loop = asyncio.get_event_loop()
+    limit = _call_limits.get(loop)
+    if limit is None:
+        limit = _call_limits[loop] = asyncio.Semaphore(ASYNC_CALL_LIMIT)
+    return limit
+
+
+class _CallProtocol(asyncio.SubprocessProtocol):
+    def __init__(self, loop):
+        # type: (asyncio.AbstractEventLoop) -> None
+        self.output = {1: bytearray(), 2: bytearray()}
+        self.exited = loop.create_future()  # type: asyncio.Future
+        self.done = loop.create_future()  # type: asyncio.Future
+
+    def pipe_data_received(self, fd, data):
+        # type: (int, bytes) -> None
+        self.output[fd] += data
+
+    def process_exited(self):
+        # type: () -> None
+        self.exited.set_result(None)
+
+    def connection_lost(self, exc):
+        # type: (Optional[Exception]) -> None
+        # the command has exited and both pipes are at EOF
+        self.done.set_result(None)
+
+
+async def async_call(ctx, # type: CephadmContext
+                     command,  # type: List[str]
+                     desc=None,  # type: Optional[str]
+                     verbose=False,  # type: bool
+                     verbose_on_failure=True,  # type: bool
+                     timeout=DEFAULT_TIMEOUT,  # type: Optional[int]
+                     **kwargs):
+    # type: (...) -> Tuple[str, str, int]
+    """
+    Asyncio counterpart of call(), taking the same arguments and returning
+    the same (out, err, returncode).
+
+    At most ASYNC_CALL_LIMIT commands run at once on an event loop, the rest
+    wait for a slot.  A command that times out, or whose task is cancelled,
+    is killed; on a timeout the output read so far is returned.
+    """
+    if desc is None:
+        desc = command[0]
+    if desc:
+        desc += ': '
+    timeout = timeout or ctx.args.timeout
+
+    loop = asyncio.get_event_loop()
+    async with _call_limit():
+        logger.debug('Running command: %s' % ' '.join(command))
+        kwargs.setdefault('stdin', None)
+        transport, protocol = await loop.subprocess_exec(
+            lambda: _CallProtocol(loop),
+            *command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            close_fds=True,
+            **kwargs
+        )
+        try:
+            await asyncio.wait_for(asyncio.shield(protocol.done), timeout)
+        except asyncio.TimeoutError:
+            logger.info(desc + 'timeout after %s seconds' % timeout)
+            transport.kill()
+            await protocol.exited
+        except BaseException:
+            transport.kill()
+            transport.close()
+            raise
+        returncode = transport.get_returncode()
+        # don't wait on pipes still held open by a child it left behind
+        transport.close()
+
+    out = protocol.output[1].decode('utf-8', 'replace')
+    err = protocol.output[2].decode('utf-8', 'replace')
+    _log_output(desc, logging.INFO if verbose else logging.DEBUG, out, err)
+    if returncode != 0 and verbose_on_failure and not verbose:
+        logger.info('Non-zero exit code %d from %s' % (returncode, ' '.join(command)))
+        _log_output(desc, logging.INFO, out, err)
+    return out, err, returncode
+
+
+class CallEngine:
+    """
+    An event loop on a background thread, for synchronous code to run
+    coroutines such as async_call() on.
+
+    The CLI commands and the exporter threads all go through the same loop,
+    so they share one concurrency limit.  A caller interrupted while
+    waiting cancels its coroutine, which kills the commands it started.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._lock = RLock()
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self._pid = 0
+
+    def _get_loop(self):
+        # type: () -> asyncio.AbstractEventLoop
+        with self._lock:
+            # a forked child doesn't get the loop's thread along
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                Thread(target=self._loop.run_forever,
+                       name='cephadm-calls', daemon=True).start()
+            return self._loop
+
+    def run(self, coro):
+        # type: (Awaitable[Any]) -> Any
+        future = asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def gather(self, coros):
+        # type: (List[Awaitable[Any]]) -> List[Any]
+        """Run coroutines concurrently, returning their results in order."""
+        async def _gather():
+            # type: () -> List[Any]
+            return await asyncio.gather(*coros)
+        return self.run(_gather())
+
+
+call_engine = CallEngine()
+
+# before 3.8 the default child watcher needs a SIGCHLD handler, which only
+# the main thread can install, so the engine's loop can't start processes;
+# run the commands one after the other with call() there instead.
+CONCURRENT_CALLS = sys.version_info >= (3, 8)
+
+
+def call_many(ctx, commands, **kwargs):
+    # type: (CephadmContext, List[List[str]], Any) -> List[Tuple[str, str, int]]
+    """
+    Run independent commands concurrently with async_call(), returning each
+    one's (out, err, returncode) in the order of `commands`.
+    """
+    if not CONCURRENT_CALLS:
+        return [call(ctx, c, **kwargs) for c in commands]
+    return call_engine.gather([async_call(ctx, c, **kwargs) for c in commands])
+
 ##################################
 
 
@@ -1219,6 +1448,29 @@ def get_file_timestamp(fn):
         return None
 
 
+def get_file_timestamps(path, names):
+    # type: (str, List[str]) -> Dict[str, str]
+    """
+    get_file_timestamp() for several files of one directory, found in a
+    single pass over it.  Files that can't be stat'ed are left out.
+    """
+    stamps = {}  # type: Dict[str, str]
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name not in names:
+                    continue
+                try:
+                    stamps[entry.name] = datetime.datetime.fromtimestamp(
+                        entry.stat().st_mtime, tz=datetime.timezone.utc
+                    ).strftime(DATEFMT)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return stamps
+
+
 def try_convert_datetime(s):
     # type: (str) -> Optional[str]
     # This is super irritating because
@@ -1675,28 +1927,55 @@ def get_unit_name_by_daemon_name(ctx: CephadmContext, fsid, name):
 
 def check_unit(ctx, unit_name):
     # type: (CephadmContext, str) -> Tuple[bool, str, bool]
+    results = []  # type: List[Any]
+    for query in ['is-enabled', 'is-active']:
+        try:
+            results.append(call(ctx, ['systemctl', query, unit_name],
+                                verbose_on_failure=False))
+        except Exception as e:
+            results.append(e)
+    return _unit_status(*results)
+
+
+async def async_check_unit(ctx, unit_name):
+    # type: (CephadmContext, str) -> Tuple[bool, str, bool]
+    results = await asyncio.gather(*[
+        async_call(ctx, ['systemctl', query, unit_name],
+                   verbose_on_failure=False)
+        for query in ['is-enabled', 'is-active']
+    ], return_exceptions=True)
+    return _unit_status(*results)
+
+
+def check_units_concurrently(ctx, unit_names):
+    # type: (CephadmContext, List[str]) -> List[Tuple[bool, str, bool]]
+    if not CONCURRENT_CALLS:
+        return [check_unit(ctx, u) for u in unit_names]
+    return call_engine.gather([async_check_unit(ctx, u) for u in unit_names])
+
+
+def _unit_status(is_enabled, is_active):
+    # type: (Any, Any) -> Tuple[bool, str, bool]
     # NOTE: we ignore the exit code here because systemctl outputs
     # various exit codes based on the state of the service, but the
     # string result is more explicit (and sufficient).
     enabled = False
     installed = False
-    try:
-        out, err, code = call(ctx, ['systemctl', 'is-enabled', unit_name],
-                              verbose_on_failure=False)
+    if isinstance(is_enabled, Exception):
+        logger.warning('unable to run systemctl: %s' % is_enabled)
+    else:
+        out, err, code = is_enabled
         if code == 0:
             enabled = True
             installed = True
         elif "disabled" in out:
             installed = True
-    except Exception as e:
-        logger.warning('unable to run systemctl: %s' % e)
-        enabled = False
-        installed = False
 
     state = 'unknown'
-    try:
-        out, err, code = call(ctx, ['systemctl', 'is-active', unit_name],
-                              verbose_on_failure=False)
+    if isinstance(is_active, Exception):
+        logger.warning('unable to run systemctl: %s' % is_active)
+    else:
+        out, err, code = is_active
         out = out.strip()
         if out in ['active']:
             state = 'running'
@@ -1704,11 +1983,6 @@ def check_unit(ctx, unit_name):
             state = 'stopped'
         elif out in ['failed', 'auto-restart']:
             state = 'error'
-        else:
-            state = 'unknown'
-    except Exception as e:
-        logger.warning('unable to run systemctl: %s' % e)
-        state = 'unknown'
     return (enabled, state, installed)
 
 
@@ -2438,6 +2712,16 @@ class Firewalld(object):
         else:
             logger.debug('firewalld service %s is enabled in current zone' % svc)
 
+    def _query_ports(self, fw_ports):
+        # type: (List[int]) -> List[Tuple[int, int]]
+        assert self.cmd
+        results = call_many(
+            self.ctx,
+            [[self.cmd, '--permanent', '--query-port', str(port) + '/tcp']
+             for port in fw_ports],
+            verbose_on_failure=False)
+        return [(port, ret) for port, (_, _, ret) in zip(fw_ports, results)]
+
     def open_ports(self, fw_ports):
         # type: (List[int]) -> None
         if not self.available:
@@ -2447,9 +2731,8 @@ class Firewalld(object):
         if not self.cmd:
             raise RuntimeError("command not defined")
 
-        for port in fw_ports:
+        for port, ret in self._query_ports(fw_ports):
             tcp_port = str(port) + '/tcp'
-            out, err, ret = call(self.ctx, [self.cmd, '--permanent', '--query-port', tcp_port], verbose_on_failure=False)
             if ret:
                 logger.info('Enabling firewalld port %s in current zone...' % tcp_port)
                 out, err, ret = call(self.ctx, [self.cmd, '--permanent', '--add-port', tcp_port])
@@ -2468,9 +2751,8 @@ class Firewalld(object):
         if not self.cmd:
             raise RuntimeError("command not defined")
 
-        for port in fw_ports:
+        for port, ret in self._query_ports(fw_ports):
             tcp_port = str(port) + '/tcp'
-            out, err, ret = call(self.ctx, [self.cmd, '--permanent', '--query-port', tcp_port], verbose_on_failure=False)
             if not ret:
                 logger.info('Disabling port %s in current zone...' % tcp_port)
                 out, err, ret = call(self.ctx, [self.cmd, '--permanent', '--remove-port', tcp_port])
@@ -3802,11 +4084,8 @@ def command_run(ctx):
 ##################################
 
 
-@infer_fsid
-@infer_config
-@infer_image
-def command_shell(ctx):
-    # type: (CephadmContext) -> int
+def _get_shell_container(ctx, interactive):
+    # type: (CephadmContext, bool) -> CephContainer
     args = ctx.args
     if args.fsid:
         make_log_dir(ctx, args.fsid)
@@ -3847,10 +4126,7 @@ def command_shell(ctx):
                 mounts[mount] = dst
             else:
                 mounts[mount] = '/mnt/{}:z'.format(filename)
-    if args.command:
-        command = args.command
-    else:
-        command = ['bash']
+    if interactive:
         container_args += [
             '-it',
             '-e', 'LANG=C',
@@ -3868,7 +4144,7 @@ def command_shell(ctx):
                                             os.path.join(home, f))
             mounts[home] = '/root'
 
-    c = CephContainer(
+    return CephContainer(
         ctx,
         image=args.image,
         entrypoint='doesnotmatter',
@@ -3878,6 +4154,31 @@ def command_shell(ctx):
         bind_mounts=binds,
         envs=args.env,
         privileged=True)
+
+
+@infer_fsid
+@infer_config
+@infer_image
+def get_shell_container(ctx):
+    # type: (CephadmContext) -> CephContainer
+    """
+    The container 'cephadm shell' would run a command in, with the same
+    mounts, for callers running their own (e.g., long-lived) containers.
+    """
+    return _get_shell_container(ctx, interactive=False)
+
+
+@infer_fsid
+@infer_config
+@infer_image
+def command_shell(ctx):
+    # type: (CephadmContext) -> int
+    args = ctx.args
+    if args.command:
+        command = args.command
+    else:
+        command = ['bash']
+    c = _get_shell_container(ctx, interactive=not args.command)
     command = c.shell_cmd(command)
 
     return call_timeout(ctx, command, args.timeout)
@@ -4092,6 +4393,44 @@ def command_ls(ctx):
     print(json.dumps(cephadm_ls(ctx), indent=4))
 
 
+def _inspect_daemon_containers(ctx, fsid, names, image_field):
+    # type: (CephadmContext, str, List[str], str) -> Dict[str, str]
+    """
+    Inspect the containers of a cluster's daemons in a single call.
+
+    Returns the comma separated id, image, image id, creation time and ceph
+    version of every daemon whose container was found, by daemon name.
+    """
+    containers = ['ceph-%s-%s' % (fsid, name) for name in names]
+    if not containers:
+        return {}
+    cmd = [
+        ctx.container_path, 'inspect',
+        '--format', '{{.Name}},{{.Id}},{{.Config.Image}},{{%s}},{{.Created}},{{index .Config.Labels "io.ceph.version"}}' % image_field,
+    ]
+
+    found = {}  # type: Dict[str, str]
+
+    def parse(out):
+        # type: (str) -> None
+        for line in out.splitlines():
+            container, _, info = line.partition(',')
+            # docker reports the name with a leading slash
+            found[container.lstrip('/')] = info
+
+    out, err, code = call(ctx, cmd + containers, verbose_on_failure=False)
+    parse(out)
+    if code:
+        # a container that doesn't exist fails the whole call, and some
+        # runtimes stop at it, so look the others up one by one
+        missing = [c for c in containers if c not in found]
+        for out, err, code in call_many(ctx, [cmd + [c] for c in missing],
+                                        verbose_on_failure=False):
+            if not code:
+                parse(out)
+    return {name: found[c] for name, c in zip(names, containers) if c in found}
+
+
 def list_daemons(ctx, detail=True, legacy_dir=None):
     # type: (CephadmContext, bool, Optional[str]) -> List[Dict[str, str]]
     host_version: Optional[str] = None
@@ -4105,6 +4444,7 @@ def list_daemons(ctx, detail=True, legacy_dir=None):
 
     # keep track of ceph versions we see
     seen_versions = {}  # type: Dict[str, Optional[str]]
+    image_field = None  # type: Optional[str]
 
     # /var/lib/ceph
     if os.path.exists(data_dir):
@@ -4127,9 +4467,8 @@ def list_daemons(ctx, detail=True, legacy_dir=None):
                         'systemd_unit': legacy_unit_name,
                     }
                     if detail:
-                        (enabled, state, _) = check_unit(ctx, legacy_unit_name)
-                        i['enabled'] = "true" if enabled else "false"
-                        i['state'] = state
+                        # filled in below, with every daemon's unit
+                        i['enabled'] = i['state'] = ''
                         if not host_version:
                             try:
                                 out, err, code = call(ctx, ['ceph', '-v'])
@@ -4141,7 +4480,18 @@ def list_daemons(ctx, detail=True, legacy_dir=None):
                     ls.append(i)
             elif is_fsid(i):
                 fsid = str(i)  # convince mypy that fsid is a str here
-                for j in os.listdir(os.path.join(data_dir, i)):
+                daemons = os.listdir(os.path.join(data_dir, i))
+                containers = {}  # type: Dict[str, str]
+                if detail:
+                    if image_field is None:
+                        if 'podman' in container_path and \
+                            get_podman_version(ctx, container_path) < (1, 6, 2):
+                            image_field = '.ImageID'
+                        else:
+                            image_field = '.Image'
+                    containers = _inspect_daemon_containers(
+                        ctx, fsid, [j for j in daemons if '.' in j], image_field)
+                for j in daemons:
                     if '.' in j:
                         name = j
                         (daemon_type, daemon_id) = j.split('.', 1)
@@ -4157,30 +4507,17 @@ def list_daemons(ctx, detail=True, legacy_dir=None):
                         'systemd_unit': unit_name,
                     }
                     if detail:
+                        # filled in below, with every daemon's unit
+                        i['enabled'] = i['state'] = ''
                         # get container id
-                        (enabled, state, _) = check_unit(ctx, unit_name)
-                        i['enabled'] = "true" if enabled else "false"
-                        i['state'] = state
                         container_id = None
                         image_name = None
                         image_id = None
                         version = None
                         start_stamp = None
 
-                        if 'podman' in container_path and \
-                            get_podman_version(ctx, container_path) < (1, 6, 2):
-                            image_field = '.ImageID'
-                        else:
-                            image_field = '.Image'
-
-                        out, err, code = call(ctx,
-                            [
-                                container_path, 'inspect',
-                                '--format', '{{.Id}},{{.Config.Image}},{{%s}},{{.Created}},{{index .Config.Labels "io.ceph.version"}}' % image_field,
-                                'ceph-%s-%s' % (fsid, j)
-                            ],
-                            verbose_on_failure=False)
-                        if not code:
+                        out = containers.get(j)
+                        if out is not None:
                             (container_id, image_name, image_id, start,
                              version) = out.strip().split(',')
                             image_id = normalize_container_id(image_id)
@@ -4240,21 +4577,23 @@ def list_daemons(ctx, detail=True, legacy_dir=None):
                         i['container_image_id'] = image_id if image_id else ""
                         i['version'] = str(version)
                         i['started'] = start_stamp if start_stamp else ""
-                        _created = get_file_timestamp(
-                            os.path.join(data_dir, fsid, j, 'unit.created')
-                        )
-                        i['created'] = _created if _created else ""
-                        _deployed = get_file_timestamp(
-                            os.path.join(data_dir, fsid, j, 'unit.image')
+                        stamps = get_file_timestamps(
+                            os.path.join(data_dir, fsid, j),
+                            ['unit.created', 'unit.image', 'unit.configured']
                         )
-                        i['deployed'] = _deployed if _deployed else ""
-                        _configured = get_file_timestamp(
-                            os.path.join(data_dir, fsid, j, 'unit.configured')
-                        )
-                        i['configured'] = _configured if _configured else ""
+                        i['created'] = stamps.get('unit.created', "")
+                        i['deployed'] = stamps.get('unit.image', "")
+                        i['configured'] = stamps.get('unit.configured', "")
 
                     ls.append(i)
 
+    if detail:
+        # systemctl is queried twice per daemon, do it for all of them at once
+        units = [i['systemd_unit'] for i in ls]
+        for i, (enabled, state, _) in zip(ls, check_units_concurrently(ctx, units)):
+            i['enabled'] = "true" if enabled else "false"
+            i['state'] = state
+
     return ls
 
 
@@ -7187,55 +7526,109 @@ def _get_parser():
 
 
 def _parse_args(av):
-    parser = _get_parser()
-    args = parser.parse_args(av)
-    if 'command' in args and args.command and args.command[0] == "--":
-        args.command.pop(0)
-    return args
+    return context_factory.parse_args(av)
 
 
-def cephadm_init(args: List[str]) -> Optional[CephadmContext]:
+class CephadmContextFactory:
+    """
+    Builds CephadmContext objects for callers creating many of them, e.g.
+    rlyeh. The argument parser, logging setup and container runtime lookup
+    are done once, on first use, instead of on every context.
+    """
 
-    global logger
-    ctx = CephadmContext()
-    ctx.args = _parse_args(args)
+    def __init__(self):
+        self._parser = None  # type: Optional[argparse.ArgumentParser]
+        self._logging_configured = False
+        self._container_paths = {}  # type: Dict[str, str]
+        self._lock = RLock()
+
+    def parser(self):
+        # type: () -> argparse.ArgumentParser
+        with self._lock:
+            if self._parser is None:
+                self._parser = _get_parser()
+            return self._parser
+
+    def parse_args(self, av):
+        # type: (List[str]) -> argparse.Namespace
+        args = self.parser().parse_args(av)
+        # the parser is shared; don't let callers mutate its list defaults.
+        for name, value in vars(args).items():
+            if isinstance(value, list):
+                setattr(args, name, list(value))
+        if 'command' in args and args.command and args.command[0] == "--":
+            args.command.pop(0)
+        return args
+
+    def setup_logging(self):
+        # type: () -> logging.Logger
+        global logger
+        with self._lock:
+            if not self._logging_configured:
+                if not os.path.exists(LOG_DIR):
+                    os.makedirs(LOG_DIR)
+                dictConfig(logging_config)
+                self._logging_configured = True
+            logger = logging.getLogger()
+            return logger
+
+    def find_container(self, name):
+        # type: (str) -> str
+        """ Like find_program(); only successful lookups are cached, as
+        prepare-host may install a runtime later on. """
+        with self._lock:
+            path = self._container_paths.get(name)
+            if path is None:
+                path = find_program(name)
+                self._container_paths[name] = path
+            return path
+
+    def reset(self):
+        # type: () -> None
+        """ Forget container runtimes found so far. """
+        with self._lock:
+            self._container_paths = {}
 
+    def create(self, args):
+        # type: (List[str]) -> Optional[CephadmContext]
+        ctx = CephadmContext()
+        ctx.args = self.parse_args(args)
+        _logger = self.setup_logging()
 
-    # Logger configuration
-    if not os.path.exists(LOG_DIR):
-        os.makedirs(LOG_DIR)
-    dictConfig(logging_config)
-    logger = logging.getLogger()
+        for handler in _logger.handlers:
+            if handler.name == "console":
+                handler.setLevel(
+                    logging.DEBUG if ctx.args.verbose else logging.INFO)
 
-    # logger.info(">>> cephadm args >>> " + str(ctx.args))
+        if "func" not in ctx.args:
+            sys.stderr.write("No command specified; pass -h or --help for usage\n")
+            return None
 
-    if ctx.args.verbose:
-        for handler in logger.handlers:
-            if handler.name == "console":
-                handler.setLevel(logging.DEBUG)
+        ctx.container_path = ""
+        if ctx.args.func != command_check_host:
+            if ctx.args.docker:
+                ctx.container_path = self.find_container("docker")
+            else:
+                for i in CONTAINER_PREFERENCE:
+                    try:
+                        ctx.container_path = self.find_container(i)
+                        break
+                    except Exception as e:
+                        _logger.debug("Could not locate %s: %s" % (i, e))
+                if not ctx.container_path and ctx.args.func != command_prepare_host\
+                        and ctx.args.func != command_add_repo:
+                    sys.stderr.write("Unable to locate any of %s\n" %
+                         CONTAINER_PREFERENCE)
+                    return None
 
-    if "func" not in ctx.args:
-        sys.stderr.write("No command specified; pass -h or --help for usage\n")
-        return None
+        return ctx
 
-    ctx.container_path = ""
-    if ctx.args.func != command_check_host:
-        if ctx.args.docker:
-            ctx.container_path = find_program("docker")
-        else:
-            for i in CONTAINER_PREFERENCE:
-                try:
-                    ctx.container_path = find_program(i)
-                    break
-                except Exception as e:
-                    logger.debug("Could not locate %s: %s" % (i, e))
-            if not ctx.container_path and ctx.args.func != command_prepare_host\
-                    and ctx.args.func != command_add_repo:
-                sys.stderr.write("Unable to locate any of %s\n" %
-                     CONTAINER_PREFERENCE)
-                return None
-
-    return ctx
+
+context_factory = CephadmContextFactory()
+
+
+def cephadm_init(args: List[str]) -> Optional[CephadmContext]:
+    return context_factory.create(args)
 
 
 def main():
@@ -20,21 +20,28 @@ interface BootstrapResult {
 }
 
 interface InventoryDevice {
+  host: string;
   available: boolean;
   path: string;
   type: string;
   size: number;
+  class: string;
 }
 
-interface InventorySolution {
-  can_raid0: boolean;
-  can_raid1: boolean;
-  raid0_size: number;
-  raid1_size: number;
+interface InventoryPlan {
+  name: string;
+  label: string;
+  available: boolean;
+  replicas: number;
+  size: number;
+  relative_iops: number;
+  num_osds: number;
+  metadata_tier: boolean;
 }
 
 interface InventoryReply {
-  solution: InventorySolution;
+  hosts: string[];
+  plans: InventoryPlan[];
   devices: InventoryDevice[];
 }
 
@@ -48,6 +55,7 @@ interface SolutionItem {
   label: string;
   available: boolean;
   size: number;
+  relative_iops: number;
 }
 
 
@@ -180,20 +188,16 @@ export class BootstrapComponent implements OnInit {
         this.available_raw_size += dev.size;
       }
     });
-    this.solutions = {
-      raid0: {
-        name: "raid0",
-        label: "RAID 0",
-        available: inventory.solution.can_raid0,
-        size: inventory.solution.raid0_size
-      },
-      raid1: {
-        name: "raid1",
-        label: "RAID 1",
-        available: inventory.solution.can_raid1,
-        size: inventory.solution.raid1_size
-      }
-    };
+    this.solutions = {};
+    inventory.plans.forEach( (plan: InventoryPlan) => {
+      this.solutions[plan.name] = {
+        name: plan.name,
+        label: plan.label,
+        available: plan.available,
+        size: plan.size,
+        relative_iops: plan.relative_iops
+      };
+    });
     this.is_inventory_waiting_user = true;
   }
 
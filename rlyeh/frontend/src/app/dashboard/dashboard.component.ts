@@ -1,21 +1,8 @@
-import { Component, OnInit } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
-import { interval } from 'rxjs';
-import { take } from 'rxjs/operators';
-
-interface PoolStatsItem {
-  used: number;
-  percent_used: number;
-  avail: number;
-  avail_raw: number;
-}
-
-interface StatsItem {
-  total_avail_bytes: number;
-  total_raw_bytes: number;
-  total_used_raw_bytes: number;
-  pools: {[id: string]: PoolStatsItem};
-}
+import { Component, OnDestroy, OnInit } from '@angular/core';
+import { Subscription } from 'rxjs';
+import {
+  BackendStateService, PoolStatsItem, StatsItem
+} from '../services/backend-state.service';
 
 interface UsageItem {
   name: string;
@@ -27,32 +14,31 @@ interface UsageItem {
   templateUrl: './dashboard.component.html',
   styleUrls: ['./dashboard.component.scss']
 })
-export class DashboardComponent implements OnInit {
+export class DashboardComponent implements OnInit, OnDestroy {
 
   public usage_data: UsageItem[] = [];
   public nfs_exports: string[] = [];
   public total_bytes_raw: number = 0;
   public total_bytes: number = 0;
 
+  private _stats_subscription?: Subscription;
 
   public constructor(
-    private _http: HttpClient
+    private _backend_state_svc: BackendStateService
   ) {}
 
   public ngOnInit(): void {
 
-    this._obtainStats();
-
-  }
-
-  private _obtainStats(): void {
-
-    this._http.get<StatsItem>("/api/df").subscribe({
+    this._stats_subscription = this._backend_state_svc.getStats().subscribe({
       next: (stats: StatsItem) => {
         this._handleStats(stats);
       }
     });
-    interval(5000).pipe(take(1)).subscribe(this._obtainStats.bind(this));
+
+  }
+
+  public ngOnDestroy(): void {
+    this._stats_subscription?.unsubscribe();
   }
 
   private _handleStats(stats: StatsItem): void {    
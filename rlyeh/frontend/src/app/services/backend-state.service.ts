@@ -1,6 +1,6 @@
 import { HttpClient } from '@angular/common/http';
-import { Injectable } from '@angular/core';
-import { BehaviorSubject, interval } from 'rxjs';
+import { Injectable, NgZone } from '@angular/core';
+import { BehaviorSubject, interval, Observable, ReplaySubject } from 'rxjs';
 import { take } from 'rxjs/operators';
 
 
@@ -8,6 +8,20 @@ export interface StatusReply {
   status: string;
 }
 
+export interface PoolStatsItem {
+  used: number;
+  percent_used: number;
+  avail: number;
+  avail_raw: number;
+}
+
+export interface StatsItem {
+  total_avail_bytes: number;
+  total_raw_bytes: number;
+  total_used_raw_bytes: number;
+  pools: {[id: string]: PoolStatsItem};
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -15,11 +29,33 @@ export class BackendStateService {
 
   private _status_subject: BehaviorSubject<StatusReply> =
     new BehaviorSubject<StatusReply>({status: "none"});
+  private _stats_subject: ReplaySubject<StatsItem> =
+    new ReplaySubject<StatsItem>(1);
 
   public constructor(
-    private _http: HttpClient
+    private _http: HttpClient,
+    private _zone: NgZone
   ) {
-    this._obtainStatus();
+    if (typeof EventSource !== "undefined") {
+      this._listenEvents();
+    } else {
+      this._obtainStatus();
+      this._obtainStats();
+    }
+  }
+
+  // the backend pushes state transitions and stats changes as they happen;
+  // EventSource reconnects on its own, resuming from the last event id.
+  private _listenEvents(): void {
+    const source: EventSource = new EventSource("/api/events");
+    source.addEventListener("status", (event: Event) => {
+      const status: StatusReply = JSON.parse((event as MessageEvent).data);
+      this._zone.run(() => this._status_subject.next(status));
+    });
+    source.addEventListener("df", (event: Event) => {
+      const stats: StatsItem = JSON.parse((event as MessageEvent).data);
+      this._zone.run(() => this._stats_subject.next(stats));
+    });
   }
 
   private _obtainStatus(): void {
@@ -31,7 +67,22 @@ export class BackendStateService {
     interval(5000).pipe(take(1)).subscribe(this._obtainStatus.bind(this));
   }
 
+  private _obtainStats(): void {
+    if (this._status_subject.value.status === "READY") {
+      this._http.get<StatsItem>("/api/df").subscribe({
+        next: (stats: StatsItem) => {
+          this._stats_subject.next(stats);
+        }
+      });
+    }
+    interval(5000).pipe(take(1)).subscribe(this._obtainStats.bind(this));
+  }
+
   public getStatus(): BehaviorSubject<StatusReply> {
     return this._status_subject;
   }
+
+  public getStats(): Observable<StatsItem> {
+    return this._stats_subject;
+  }
 }
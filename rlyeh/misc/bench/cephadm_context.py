@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+#
+# micro-benchmark: cost of creating a cephadm context, rebuilding everything
+# on each call (as cephadm_init used to) versus through the shared factory.
+#
+# run from rlyeh's directory, as root: python3 misc/bench/cephadm_context.py
+#
+
+import contextlib
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.getcwd())
+
+from cephadm import cephadm   # noqa: E402
+
+
+ARGS = "shell -- ceph".split()
+
+
+def uncached() -> None:
+    factory = cephadm.CephadmContextFactory()
+    factory.create(ARGS)
+
+
+def cached() -> None:
+    cephadm.context_factory.create(ARGS)
+
+
+def main() -> None:
+    number: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    results = {}
+    # without a container runtime, each context complains on stderr.
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stderr(devnull):
+        cached()    # warm up; pays the one-time costs
+        for name, func in [("uncached", uncached), ("cached", cached)]:
+            best: float = min(timeit.repeat(func, number=number, repeat=5))
+            results[name] = best / number
+    for name in results:
+        print(f"{name:>10}: {results[name] * 1e6:10.1f} us per context")
+    print(f"{'speedup':>10}: {results['uncached'] / results['cached']:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+#
+# drive rlyeh's api at a given concurrency, and report latency percentiles
+# and throughput per endpoint.
+#
+#   python3 misc/bench/load.py --url http://127.0.0.1:1337 \
+#       --concurrency 32 --duration 30 df status services/nfs inventory
+#
+
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+
+DEFAULT_ENDPOINTS: List[str] = ["df", "status", "services/nfs", "inventory"]
+
+
+class Results:
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint: str, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(latency)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    if len(ordered) == 0:
+        return 0.0
+    idx: int = min(int(round(p / 100.0 * (len(ordered) - 1))),
+                   len(ordered) - 1)
+    return ordered[idx]
+
+
+def _worker(
+    host: str,
+    port: int,
+    endpoints: List[str],
+    offset: int,
+    deadline: float,
+    results: Results
+) -> None:
+    conn: Optional[http.client.HTTPConnection] = None
+    n: int = offset
+    while time.monotonic() < deadline:
+        endpoint: str = endpoints[n % len(endpoints)]
+        n += 1
+        if conn is None:
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+        start: float = time.perf_counter()
+        ok: bool = False
+        try:
+            conn.request("GET", f"/api/{endpoint}")
+            res = conn.getresponse()
+            res.read()
+            ok = res.status < 400
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = None
+        results.add(endpoint, time.perf_counter() - start, ok)
+    if conn is not None:
+        conn.close()
+
+
+def run(
+    url: str,
+    endpoints: List[str],
+    concurrency: int,
+    duration: float
+) -> Tuple[Results, float]:
+    parsed = urlparse(url)
+    host: str = parsed.hostname or "127.0.0.1"
+    port: int = parsed.port or 80
+    results = Results()
+    start: float = time.monotonic()
+    deadline: float = start + duration
+    threads: List[threading.Thread] = [
+        threading.Thread(
+            target=_worker,
+            args=(host, port, endpoints, i, deadline, results),
+            daemon=True
+        )
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.monotonic() - start
+
+
+def report(results: Results, elapsed: float) -> Dict[str, Dict[str, float]]:
+    summary: Dict[str, Dict[str, float]] = {}
+    everything: List[float] = []
+    for endpoint, latencies in sorted(results.latencies.items()):
+        ordered = sorted(latencies)
+        everything += ordered
+        summary[endpoint] = {
+            "requests": len(ordered),
+            "errors": results.errors.get(endpoint, 0),
+            "rps": len(ordered) / elapsed,
+            "p50": _percentile(ordered, 50) * 1000,
+            "p95": _percentile(ordered, 95) * 1000,
+            "p99": _percentile(ordered, 99) * 1000
+        }
+    everything.sort()
+    summary["total"] = {
+        "requests": len(everything),
+        "errors": sum(results.errors.values()),
+        "rps": len(everything) / elapsed,
+        "p50": _percentile(everything, 50) * 1000,
+        "p95": _percentile(everything, 95) * 1000,
+        "p99": _percentile(everything, 99) * 1000
+    }
+    return summary
+
+
+def print_report(summary: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'endpoint':<16}{'requests':>10}{'errors':>8}{'rps':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, s in summary.items():
+        print(f"{endpoint:<16}{s['requests']:>10.0f}{s['errors']:>8.0f}"
+              f"{s['rps']:>10.1f}{s['p50']:>10.2f}{s['p95']:>10.2f}"
+              f"{s['p99']:>10.2f}")
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Load test for the rlyeh api.")
+    parser.add_argument("--url", default="http://127.0.0.1:1337")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds to run for")
+    parser.add_argument("--json", action="store_true",
+                        help="print the summary as json")
+    parser.add_argument("endpoints", nargs="*", default=DEFAULT_ENDPOINTS,
+                        help="api endpoints to cycle through")
+    return parser
+
+
+def main(av: List[str]) -> None:
+    args = get_parser().parse_args(av)
+    results, elapsed = run(
+        args.url, args.endpoints, args.concurrency, args.duration
+    )
+    summary = report(results, elapsed)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+#
+# end to end api benchmark: starts the stub dashboard, seeds a READY
+# deployment pointing at it, starts rlyeh, and runs the load test.
+#
+# run from rlyeh's directory:
+#   python3 misc/bench/run.py --workers 2 --concurrency 32 --latency 20
+#
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List
+
+BENCH_DIR: str = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import load                 # noqa: E402
+import stub_dashboard       # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(what: str, check: Any, timeout: float = 30.0) -> None:
+    deadline: float = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise Exception(f"timed out waiting for {what}")
+
+
+def _seed(conf: str, port: int, nhosts: int, ndevs: int) -> None:
+    """
+    A deployment that's READY and talks to the stub on 'port', with the
+    inventory of the stub's hosts.
+    """
+
+    os.environ["RLYEH_CONF_PATH"] = conf
+    sys.path.insert(0, os.getcwd())
+    import rlyeh    # noqa: E402
+
+    gstate = rlyeh.GlobalState()
+    gstate.state = rlyeh.State.READY
+    gstate.host = "127.0.0.1"
+    gstate.port = port
+    gstate.username = "admin"
+    gstate.password = "admin"
+    gstate.inventory = rlyeh._calc_storage_solutions({
+        f"node{i}": stub_dashboard._inventory(f"node{i}", ndevs)
+        for i in range(nhosts)
+    })
+
+    db = rlyeh._connect_db(os.path.join(conf, rlyeh.STATE_DB))
+    db.execute(
+        "UPDATE state SET version = 1, data = ? WHERE id = 0",
+        (json.dumps(gstate.dump()),)
+    )
+    db.close()
+
+
+def main(av: List[str]) -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark rlyeh's api against a stub dashboard.")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="stub dashboard latency, in ms")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail", type=float, default=0.0,
+                        help="fraction of stub requests failing")
+    parser.add_argument("--hosts", type=int, default=1)
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--exports", type=int, default=4)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("endpoints", nargs="*",
+                        default=load.DEFAULT_ENDPOINTS)
+    args = parser.parse_args(av)
+
+    stub_port: int = _free_port()
+    api_port: int = _free_port()
+    procs: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory() as conf:
+        try:
+            procs.append(subprocess.Popen([
+                sys.executable, os.path.join(BENCH_DIR, "stub_dashboard.py"),
+                "--port", str(stub_port),
+                "--latency", str(args.latency),
+                "--jitter", str(args.jitter),
+                "--fail", str(args.fail),
+                "--hosts", str(args.hosts),
+                "--devices", str(args.devices),
+                "--exports", str(args.exports)
+            ]))
+            _seed(conf, stub_port, args.hosts, args.devices)
+
+            env: Dict[str, str] = dict(os.environ, RLYEH_CONF_PATH=conf)
+            procs.append(subprocess.Popen([
+                sys.executable, "-m", "uvicorn",
+                "--log-level", "warning",
+                "--host", "127.0.0.1", "--port", str(api_port),
+                "--workers", str(args.workers),
+                "rlyeh:app"
+            ], env=env))
+
+            url: str = f"http://127.0.0.1:{api_port}"
+            _wait_for("rlyeh", lambda: urllib.request.urlopen(
+                f"{url}/api/df", timeout=1
+            ).status == 200)
+
+            results, elapsed = load.run(
+                url, args.endpoints, args.concurrency, args.duration
+            )
+            summary = load.report(results, elapsed)
+            if args.json:
+                print(json.dumps(summary, indent=2))
+            else:
+                load.print_report(summary)
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
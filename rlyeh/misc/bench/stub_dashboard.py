@@ -0,0 +1,319 @@
+#!/usr/bin/python3
+#
+# stub of the ceph dashboard rest api, as far as rlyeh uses it, serving
+# canned but plausible replies over https. Latency and failures can be
+# injected, to see how rlyeh holds up when the dashboard doesn't.
+#
+#   python3 misc/bench/stub_dashboard.py --port 8443 --latency 20 --fail 0.01
+#
+
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+TiB = 1024 ** 4
+
+
+def _token(lifetime: float) -> str:
+    def _b64(d: Dict[str, Any]) -> str:
+        raw: bytes = json.dumps(d).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    header: str = _b64({ "alg": "none", "typ": "JWT" })
+    payload: str = _b64({ "username": "admin", "exp": time.time() + lifetime })
+    return f"{header}.{payload}.stub"
+
+
+def _inventory(host: str, ndevs: int) -> Dict[str, Any]:
+    devices: List[Dict[str, Any]] = []
+    for i in range(ndevs):
+        rotational: bool = i % 4 != 3
+        path: str = f"/dev/sd{chr(ord('b') + i)}" if rotational \
+            else f"/dev/nvme{i}n1"
+        devices.append({
+            "path": path,
+            "available": True,
+            "human_readable_type": "hdd" if rotational else "ssd",
+            "sys_api": {
+                "size": 4 * TiB if rotational else TiB,
+                "rotational": "1" if rotational else "0"
+            }
+        })
+    return { "name": host, "addr": host, "devices": devices }
+
+
+class Dashboard:
+    """ The stub's canned cluster; replies are built once. """
+
+    def __init__(self, nhosts: int, ndevs: int, nexports: int) -> None:
+        self.hosts: List[str] = [f"node{i}" for i in range(nhosts)]
+        self.inventories: Dict[str, Any] = {
+            host: _inventory(host, ndevs) for host in self.hosts
+        }
+        names: List[str] = [f"share{i}" for i in range(nexports)]
+        self.exports: List[Dict[str, Any]] = [
+            {
+                "export_id": i + 1,
+                "cluster_id": f"{name}-nfs",
+                "pseudo": f"/{name}",
+                "access_type": "RW",
+                "fsal": { "name": "CEPH", "fs_name": name }
+            }
+            for i, name in enumerate(names)
+        ]
+        self.pools: List[Dict[str, Any]] = [
+            {
+                "pool_name": f"cephfs.{name}.{kind}",
+                "stats": {
+                    "bytes_used": { "latest": random.randint(0, TiB) },
+                    "percent_used": { "latest": random.random() },
+                    "max_avail": { "latest": 8 * TiB },
+                    "avail_raw": { "latest": 16 * TiB }
+                }
+            }
+            for name in names for kind in ["meta", "data"]
+        ]
+        self.config: Dict[str, Any] = {}
+        self.config_lock = threading.Lock()
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "health": { "status": "HEALTH_OK", "checks": [] },
+            "osd_map": {
+                "osds": [
+                    { "osd": i, "up": 1, "in": 1 }
+                    for i in range(len(self.hosts) * 4)
+                ]
+            },
+            "df": {
+                "stats": {
+                    "total_avail_bytes": 48 * TiB,
+                    "total_bytes": 64 * TiB,
+                    "total_used_raw_bytes": 16 * TiB
+                }
+            }
+        }
+
+    def cluster_conf(self, names: List[str]) -> List[Dict[str, Any]]:
+        with self.config_lock:
+            return [
+                {
+                    "name": name,
+                    "value": [{ "section": "global", "value": value }]
+                }
+                for name, value in self.config.items() if name in names
+            ]
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _reply(self, status: int, body: Any) -> None:
+        raw: bytes = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _body(self) -> Any:
+        length: int = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length > 0 else None
+
+    def _handle(self, method: str) -> None:
+        url = urlparse(self.path)
+        path: str = url.path[len("/api/"):] \
+            if url.path.startswith("/api/") else url.path
+        body: Any = self._body() if method in ["POST", "PUT"] else None
+
+        self.server.inject_latency()
+        if self.server.inject_failure():
+            self._reply(500, { "detail": "injected failure" })
+            return
+
+        if path == "auth" and method == "POST":
+            self._reply(201, { "token": _token(self.server.token_lifetime) })
+            return
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._reply(401, { "detail": "not authenticated" })
+            return
+
+        route = self.server.route(method, path)
+        if route is None:
+            self._reply(404, { "detail": f"no stub for {method} {path}" })
+            return
+        handler, match = route
+        status, reply = handler(self.server.dashboard, match, url, body)
+        self._reply(status, reply)
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def do_PUT(self) -> None:
+        self._handle("PUT")
+
+
+Route = Callable[[Dashboard, Any, Any, Any], Tuple[int, Any]]
+
+
+def _set_config(d: Dashboard, body: Any) -> Tuple[int, Any]:
+    # rlyeh sends { "options": { name: { "section": ..., "value": ... } } }
+    with d.config_lock:
+        for name, opt in body.get("options", {}).items():
+            d.config[name] = opt["value"]
+    return 200, None
+
+
+ROUTES: List[Tuple[str, str, Route]] = [
+    ("GET", r"health/minimal", lambda d, m, u, b: (200, d.health())),
+    ("GET", r"pool", lambda d, m, u, b: (200, d.pools)),
+    ("GET", r"nfs-ganesha/export", lambda d, m, u, b: (200, d.exports)),
+    ("GET", r"nfs-ganesha/daemon", lambda d, m, u, b: (200, [
+        { "cluster_id": e["cluster_id"], "status": 1 } for e in d.exports
+    ])),
+    ("GET", r"cephfs", lambda d, m, u, b: (200, [
+        {
+            "mdsmap": {
+                "fs_name": e["fsal"]["fs_name"],
+                "info": { "gid": { "state": "up:active" } }
+            }
+        }
+        for e in d.exports
+    ])),
+    ("GET", r"cluster_conf/filter", lambda d, m, u, b: (
+        200, d.cluster_conf(
+            parse_qs(u.query).get("names", [""])[0].split(",")
+        )
+    )),
+    ("PUT", r"cluster_conf", lambda d, m, u, b: _set_config(d, b)),
+    ("GET", r"orchestrator/status", lambda d, m, u, b: (
+        200, { "available": True, "message": "" }
+    )),
+    ("GET", r"host", lambda d, m, u, b: (200, [
+        { "hostname": h, "sources": { "ceph": True, "orchestrator": True } }
+        for h in d.hosts
+    ])),
+    ("GET", r"host/([^/]+)/inventory", lambda d, m, u, b: (
+        (200, d.inventories[m.group(1)])
+        if m.group(1) in d.inventories else (404, { "detail": "no host" })
+    )),
+]
+
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        dashboard: Dashboard,
+        latency: float,
+        jitter: float,
+        fail: float,
+        token_lifetime: float,
+        verbose: bool
+    ) -> None:
+        super().__init__(address, Handler)
+        self.dashboard = dashboard
+        self.latency = latency
+        self.jitter = jitter
+        self.fail = fail
+        self.token_lifetime = token_lifetime
+        self.verbose = verbose
+        self._routes = [
+            (method, re.compile(pattern + "$"), route)
+            for method, pattern, route in ROUTES
+        ]
+
+    def route(self, method: str, path: str) -> Optional[Tuple[Route, Any]]:
+        for m, pattern, route in self._routes:
+            match = pattern.match(path)
+            if m == method and match is not None:
+                return route, match
+        return None
+
+    def inject_latency(self) -> None:
+        delay: float = self.latency + random.uniform(-1, 1) * self.jitter
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def inject_failure(self) -> bool:
+        return self.fail > 0 and random.random() < self.fail
+
+
+def _self_signed(directory: str) -> Tuple[str, str]:
+    cert: str = os.path.join(directory, "stub.crt")
+    key: str = os.path.join(directory, "stub.key")
+    subprocess.run([
+        "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+        "-days", "1", "-subj", "/CN=localhost",
+        "-keyout", key, "-out", cert
+    ], check=True, capture_output=True)
+    return cert, key
+
+
+def serve(args: argparse.Namespace) -> None:
+    dashboard = Dashboard(args.hosts, args.devices, args.exports)
+    server = StubServer(
+        (args.bind, args.port), dashboard, args.latency, args.jitter,
+        args.fail, args.token_lifetime, args.verbose
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = _self_signed(tmp)
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(cert, key)
+    server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    print(f"stub dashboard on https://{args.bind}:{server.server_port}",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Stub of the ceph dashboard api, for benchmarking.")
+    parser.add_argument("--bind", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="added latency per request, in ms")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="latency varies by up to this much, in ms")
+    parser.add_argument("--fail", type=float, default=0.0,
+                        help="fraction of requests failing with a 500")
+    parser.add_argument("--token-lifetime", type=float, default=3600.0,
+                        help="seconds until issued tokens expire")
+    parser.add_argument("--hosts", type=int, default=1)
+    parser.add_argument("--devices", type=int, default=4,
+                        help="devices per host")
+    parser.add_argument("--exports", type=int, default=4)
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+if __name__ == "__main__":
+    serve(get_parser().parse_args(sys.argv[1:]))
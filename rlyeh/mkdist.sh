@@ -12,5 +12,16 @@ if ! ls frontend/dist/cthulhu/main.*.js >&/dev/null ; then
     exit 1
 fi
 
+# precompressed variants, served as-is by rlyeh to clients accepting them.
+find frontend/dist/cthulhu -type f \
+    \( -name '*.js' -o -name '*.css' -o -name '*.html' -o -name '*.svg' \
+       -o -name '*.json' -o -name '*.txt' -o -name '*.ico' \) |
+while read -r f ; do
+    gzip -9 -k -f -n "${f}"
+    if command -v brotli >&/dev/null ; then
+        brotli -q 11 -k -f "${f}"
+    fi
+done
+
 tar -C frontend/dist -cvf misc/dist/cthulhu.tar cthulhu/
 
@@ -2,20 +2,128 @@
 
 import os
 import asyncio
+import base64
+import bisect
+import copy
+import math
+import random
+import socket
+import sqlite3
+import functools
+import hashlib
 import json
 import logging
+import mimetypes
+import re
+import shlex
+import threading
+import time
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from enum import Enum
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from concurrent.futures.thread import ThreadPoolExecutor
-from fastapi import FastAPI, BackgroundTasks, HTTPException
-from fastapi.staticfiles import StaticFiles
-from typing import Callable, List, Optional, Dict, Any
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import (
+    Callable, Deque, Iterator, List, NamedTuple, Optional, Dict, Any, Tuple
+)
 from pydantic import BaseModel
 
 
 from cephadm import cephadm
 
-CONF_PATH = "/etc/rlyeh"
+CONF_PATH = os.environ.get("RLYEH_CONF_PATH", "/etc/rlyeh")
+
+# storage planning; relative random io of a single device, per media
+MEDIA_IOPS: Dict[str, float] = { "hdd": 1.0, "ssd": 40.0, "nvme": 150.0 }
+NVME_OSDS_PER_DEVICE = 2          # a single osd can't keep an nvme busy
+NVME_SPLIT_SPEEDUP = 1.5          # what splitting an nvme buys, roughly
+DB_ON_FLASH_SPEEDUP = 2.0         # hdd osd with db/wal on flash vs. hdd alone
+PLAN_REPLICAS: List[int] = [1, 2, 3]
+INVENTORY_WORKERS = 8             # host inventories fetched at once
+METADATA_CRUSH_RULE = "rlyeh-metadata"
+DATA_CRUSH_RULE = "rlyeh-data"
+OSD_CRUSH_RULE = "rlyeh-replicated"   # replicas across osds, for one host
+
+# background jobs
+JOB_WORKERS = 4                   # jobs running at once, overall
+JOB_LIMITS: Dict[str, int] = {    # jobs of a kind running at once
+    "restart": 1, "start": 1, "provision": 1, "services": 1
+}
+JOB_HISTORY = 100                 # finished jobs kept around
+
+# provisioning steps
+STEP_WORKERS = 4                  # independent steps run concurrently
+
+# state persistence, shared by all workers
+STATE_DB = "rlyeh.db"
+STATE_DB_TIMEOUT = 10.0           # seconds to wait for another worker's lock
+STATE_FLUSH_DELAY = 0.05          # seconds to gather updates into one write
+STATE_FLUSH_RETRY = 1.0           # seconds between attempts at a failed write
+
+# workers; one leader runs the jobs, the others only serve the api
+LEADER_LEASE = "leader"
+LEADER_LEASE_TTL = 15.0           # a leader silent for this long is replaced
+WORKER_TICK = 0.5                 # seconds between state syncs and lease checks
+COMMAND_WAIT = 5.0                # seconds to wait for the leader to take a job
+
+# dashboard client tunables
+DASHBOARD_POOL_SIZE = 8
+DASHBOARD_CONNECT_TIMEOUT = 5.0   # seconds
+DASHBOARD_READ_TIMEOUT = 60.0     # seconds
+TOKEN_REFRESH_MARGIN = 60.0       # refresh this many seconds before expiry
+
+# background cluster poller
+POLLER_INTERVAL = 5.0             # seconds between refreshes
+POLLER_WAIT_TIMEOUT = 10.0        # seconds a handler waits for a first refresh
+
+# waiting on cluster conditions
+WAIT_INITIAL_INTERVAL = 0.5       # seconds before the first re-probe
+WAIT_MAX_INTERVAL = 10.0          # backoff ceiling, in seconds
+WAIT_DEADLINE = 300.0             # give up after this many seconds
+
+# service creation
+SERVICE_WORKERS = 4               # nfs services set up concurrently
+
+# long-running containers to run ceph commands in
+CEPH_SHELL_POOL_SIZE = SERVICE_WORKERS
+CEPH_SHELL_MAX_USES = 100         # recycle a container after this many commands
+CEPH_SHELL_CHECK_AGE = 30.0       # check idle containers older than this, in s
+CEPH_SHELL_TIMEOUT = 300          # per command, in seconds
+
+# usage history, as (resolution, slots) tiers
+HISTORY_TIERS: List[Tuple[int, int]] = [
+    (10, 360),      # 10 seconds, for an hour
+    (300, 2016),    # 5 minutes, for a week
+]
+HISTORY_MAX_SERIES = 64           # cluster total plus this many pools, at most
+HISTORY_SAVE_INTERVAL = 300.0     # seconds between writes to disk
+
+# event stream
+EVENT_BACKLOG = 256               # events kept around for resuming clients
+EVENT_HEARTBEAT = 15.0            # seconds between keep-alive comments
+EVENT_RETRY = 3000                # client reconnect delay, in milliseconds
+
+# frontend assets
+STATIC_DIR = "frontend/dist/cthulhu"
+STATIC_CACHE_BYTES = 32 * 1024 * 1024   # assets kept in memory, at most
+STATIC_CACHE_MAX_FILE = 4 * 1024 * 1024  # larger files are never kept
+STATIC_ENCODINGS: List[Tuple[str, str]] = [("br", ".br"), ("gzip", ".gz")]
+STATIC_HASHED = re.compile(r"\.[0-9a-f]{16,}\.[a-z0-9]+$")
+
+# metrics, latency histogram bucket bounds in seconds
+METRICS_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+STEP_BUCKETS: Tuple[float, ...] = (
+    1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0
+)
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -49,7 +157,8 @@ class State(Enum):
 class GlobalState:
 
     def __init__(self) -> None:
-        self.state: State = State.NONE
+        self._state: State = State.NONE
+        self._state_listeners: List[Callable[[State], None]] = []
         self.fsid: str = ""
         self.host: str = ""
         self.port: int = -1
@@ -57,8 +166,39 @@ class GlobalState:
         self.password: str = ""
         self.token: str = ""
         self.inventory: Dict[str, Any] = {}
+        self.plan: Dict[str, Any] = {}
+        self.services: Dict[str, Any] = {}
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._steps_lock = threading.Lock()
+
+    @property
+    def state(self) -> State:
+        return self._state
+
+    @state.setter
+    def state(self, state: State) -> None:
+        changed: bool = (state != self._state)
+        self._state = state
+        if changed:
+            for listener in self._state_listeners:
+                listener(state)
+
+    def add_state_listener(self, listener: Callable[[State], None]) -> None:
+        """ Call 'listener' on every state transition, from any thread. """
+        self._state_listeners.append(listener)
+
+    def record_step(self, name: str, **fields: Any) -> None:
+        """ Update a provisioning step's record; safe from any thread. """
+        with self._steps_lock:
+            self.steps[name] = dict(self.steps.get(name, {}), **fields)
+
+    def step_done(self, name: str) -> bool:
+        with self._steps_lock:
+            return self.steps.get(name, {}).get("status") == "done"
 
     def dump(self) -> Dict[str, Any]:
+        with self._steps_lock:
+            steps = { name: dict(rec) for name, rec in self.steps.items() }
         return {
             "state": self.state.name,
             "fsid": self.fsid,
@@ -66,7 +206,11 @@ class GlobalState:
             "port": self.port,
             "username": self.username,
             "password": self.password,
-            "token": self.token
+            "token": self.token,
+            "inventory": self.inventory,
+            "plan": self.plan,
+            "services": self.services,
+            "steps": steps
         }
 
     def load(self, d: Dict[str, Any]) -> None:
@@ -77,14 +221,31 @@ class GlobalState:
         self.username = d["username"]
         self.password = d["password"]
         self.token = d["token"]
+        self.inventory = d.get("inventory", {})
+        self.plan = d.get("plan", {})
+        self.services = d.get("services", {})
+        self.steps = d.get("steps", {})
 
 
 class SolutionAcceptItem(BaseModel):
     name: str
 
 
+class NFSExportItem(BaseModel):
+    name: str                   # cephfs volume, nfs cluster is '<name>-nfs'
+    binding: str = "/cephfs"    # pseudo path
+    path: str = "/"             # path within the volume
+    readonly: bool = False
+
+
 class ServiceDescriptorItem(BaseModel):
-    nfs_name: List[str]
+    nfs_name: List[str] = []
+    exports: List[NFSExportItem] = []
+
+    def all_exports(self) -> List[NFSExportItem]:
+        """ Exports from 'nfs_name' get the defaults, as they used to. """
+        return [NFSExportItem(name=name) for name in self.nfs_name] + \
+            self.exports
 
 
 class ServiceNFSItem(BaseModel):
@@ -107,73 +268,740 @@ class StatsItem(BaseModel):
     pools: Dict[str, StatsNFSItem]
 
 
+class UsageHistoryItem(BaseModel):
+    series: str
+    resolution: int
+    points: List[Tuple[float, float, float]]  # timestamp, used, avail
+    fill_rate: Optional[float]      # bytes per second
+    time_to_full: Optional[float]   # seconds
+
+
 app = FastAPI()
 api = FastAPI()
 
 
-def load_state(gstate: GlobalState) -> None:
+# -------------- metrics --------------
+#
+# prometheus text exposition, without pulling in a client library.
+# Observing is a bisect and a few additions under a per-histogram lock, so
+# instrumentation stays on all the time; everything else is computed when
+# scraped.
+#
+def _metric_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if len(names) == 0:
+        return ""
+    escaped = [
+        v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        for v in values
+    ]
+    pairs = [f'{n}="{v}"' for n, v in zip(names, escaped)]
+    return "{" + ",".join(pairs) + "}"
+
+
+def _metric_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = METRICS_BUCKETS
+    ) -> None:
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # per label values: non-cumulative bucket counts (+Inf last), sum.
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        idx: int = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[labels] = series
+            series[0][idx] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {
+                labels: (list(counts), total[0])
+                for labels, (counts, total) in self._series.items()
+            }
 
-    if not os.path.isdir(CONF_PATH):
-        os.mkdir(CONF_PATH)
+        lines: List[str] = [
+            f"# HELP {self.name} {self.doc}",
+            f"# TYPE {self.name} histogram"
+        ]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative: int = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lbl = _metric_labels(names, labels + (_metric_value(bound),))
+                lines.append(f"{self.name}_bucket{lbl} {cumulative}")
+            lbl = _metric_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{lbl} {_metric_value(total)}")
+            lines.append(f"{self.name}_count{lbl} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """ Sampled when scraped; 'collect' returns (label values, value). """
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labelnames: Tuple[str, ...],
+        collect: Callable[[], List[Tuple[Tuple[str, ...], float]]]
+    ) -> None:
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines: List[str] = [
+            f"# HELP {self.name} {self.doc}",
+            f"# TYPE {self.name} gauge"
+        ]
+        try:
+            samples = self.collect()
+        except Exception as e:
+            logger.debug(f"metrics: unable to collect {self.name}: {str(e)}")
+            return lines
+        for labels, value in samples:
+            lbl = _metric_labels(self.labelnames, labels)
+            lines.append(f"{self.name}{lbl} {_metric_value(value)}")
+        return lines
 
-    if os.path.exists(os.path.join(CONF_PATH, "state.json")):
-        _read_state(gstate)
-    else:
-        _write_state(gstate)
+
+class Metrics:
+
+    def __init__(self) -> None:
+        self.api_requests = Histogram(
+            "rlyeh_api_request_duration_seconds",
+            "Time spent handling api requests.",
+            ("method", "route", "status")
+        )
+        self.dashboard_requests = Histogram(
+            "rlyeh_dashboard_request_duration_seconds",
+            "Time spent on requests to the ceph dashboard.",
+            ("method", "endpoint")
+        )
+        self.steps = Histogram(
+            "rlyeh_step_duration_seconds",
+            "Time spent running provisioning steps.",
+            ("step", "result"),
+            STEP_BUCKETS
+        )
+        self._metrics: List[Any] = [
+            self.api_requests, self.dashboard_requests, self.steps
+        ]
+
+    def gauge(
+        self,
+        name: str,
+        doc: str,
+        collect: Callable[[], List[Tuple[Tuple[str, ...], float]]],
+        labelnames: Tuple[str, ...] = ()
+    ) -> None:
+        self._metrics.append(Gauge(name, doc, labelnames, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _executor_backlog(executor: ThreadPoolExecutor) -> float:
+    """ Work items submitted but not yet picked up by a thread. """
+    return float(executor._work_queue.qsize())
+
+
+class MetricsMiddleware:
+    """
+    Times every request to the api app, labeled by route template rather
+    than by path, so path parameters don't blow up the number of series.
+    Times the whole exchange, streaming bodies included.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self._routes: Dict[Any, str] = {}
+
+    def _route(self, scope: Dict[str, Any]) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._routes.get(endpoint)
+        if path is None:
+            path = "unknown"
+            for route in api.routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = getattr(route, "path", path)
+                    break
+            self._routes[endpoint] = path
+        return path
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status: List[int] = [500]
+
+        async def _send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start: float = time.monotonic()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            metrics: Optional[Metrics] = getattr(app.state, "metrics", None)
+            if metrics is not None:
+                metrics.api_requests.observe(
+                    time.monotonic() - start,
+                    scope["method"], self._route(scope), str(status[0])
+                )
 
 
-def _read_state(gstate: GlobalState) -> None:
+api.add_middleware(MetricsMiddleware)
 
-    path = os.path.join(CONF_PATH, "state.json")
-    assert os.path.exists(path)
 
-    with open(path, "r") as fd:
-        d = json.load(fd)
-        assert isinstance(d, dict)
+# -------------- state persistence --------------
+#
+# state lives in an sqlite database, in WAL mode, shared by all uvicorn
+# workers. Only the leader worker writes it (see WorkerCoordinator), and
+# updates arriving in a burst are coalesced into a single durable write.
+#
+def _connect_db(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, timeout=STATE_DB_TIMEOUT, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=FULL")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS state (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL,
+            data TEXT
+        );
+        INSERT OR IGNORE INTO state (id, version, data) VALUES (0, 0, NULL);
+        CREATE TABLE IF NOT EXISTS lease (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS commands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            args TEXT NOT NULL,
+            claimed INTEGER NOT NULL DEFAULT 0,
+            job TEXT
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            submitted REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS usage (
+            series TEXT NOT NULL,
+            step INTEGER NOT NULL,
+            stamp REAL NOT NULL,
+            used REAL NOT NULL,
+            avail REAL NOT NULL,
+            PRIMARY KEY (series, step, stamp)
+        );
+        CREATE TABLE IF NOT EXISTS snapshot (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            stamp REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+    """)
+    return db
+
+
+class SharedDB:
+    """ One connection to the shared database per thread. """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        db: Optional[sqlite3.Connection] = getattr(self._local, "db", None)
+        if db is None:
+            db = _connect_db(self.path)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """ Write transaction; excludes writers in every other worker. """
+        db = self.get()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+
+class StateStore:
+    """
+    Durable home for GlobalState dumps. Every accepted update gets a new,
+    monotonically increasing version; readers, in this worker or any other,
+    compare versions to notice changes without looking at the state itself.
+    Writes are fenced by the leader lease: once a worker is no longer the
+    leader, its updates are dropped rather than clobbering the new leader's.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        holder: str,
+        flush_delay: float = STATE_FLUSH_DELAY
+    ) -> None:
+        self.path = path
+        self.holder = holder
+        self.version: int = 0
+        self.db = SharedDB(os.path.join(path, STATE_DB))
+        self._flush_delay = flush_delay
+        self._latest: Optional[Dict[str, Any]] = None
+        self._pending: Optional[Tuple[int, Dict[str, Any]]] = None
+        self._closed: bool = False
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._flusher = threading.Thread(
+            target=self._flush_loop, name="state-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    def _load_legacy(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """ State from the json files earlier versions kept, if any. """
+
+        state_path: str = os.path.join(self.path, "state.json")
+        journal_path: str = os.path.join(self.path, "state.journal")
+        version: int = 0
+        d: Optional[Dict[str, Any]] = None
+        if os.path.exists(state_path):
+            with open(state_path, "r") as fd:
+                d = json.load(fd)
+            assert isinstance(d, dict)
+            version = d.get("version", 0)
+
+        if os.path.exists(journal_path):
+            with open(journal_path, "r") as fd:
+                for line in fd:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break   # torn write; nothing after it counts.
+                    if rec["version"] > version:
+                        version, d = rec["version"], rec["state"]
+
+        return (version, d) if d is not None else None
+
+    def current_version(self) -> int:
+        """ Latest committed version, by whichever worker. """
+        row = self.db.get().execute(
+            "SELECT version FROM state WHERE id = 0"
+        ).fetchone()
+        return row[0] if row is not None else 0
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """ Latest durable state, or None if there's none yet. """
+
+        row = self.db.get().execute(
+            "SELECT version, data FROM state WHERE id = 0"
+        ).fetchone()
+        version: int = row[0] if row is not None else 0
+        d: Optional[Dict[str, Any]] = None
+        if row is not None and row[1] is not None:
+            d = json.loads(row[1])
+        elif version == 0:
+            legacy = self._load_legacy()
+            if legacy is not None:
+                logger.info("importing state from json files")
+                version, d = legacy
+
+        with self._cond:
+            self.version = version
+            self._latest = d
+        return d
+
+    def update(self, d: Dict[str, Any]) -> int:
+        """ Queue 'd' to be written; returns its version. """
+        with self._cond:
+            if d == self._latest:
+                return self.version
+            self.version += 1
+            self._latest = d
+            self._pending = (self.version, d)
+            self._cond.notify()
+            return self.version
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            # let the rest of the burst arrive.
+            time.sleep(self._flush_delay)
+            try:
+                self.flush()
+            except Exception as e:
+                # the dump is pending again; try once more after a pause.
+                logger.error(f"unable to write state: {e}")
+                time.sleep(STATE_FLUSH_RETRY)
+
+    def flush(self) -> None:
+        """ Durably write whatever is pending, now. """
+        with self._write_lock:
+            with self._cond:
+                pending = self._pending
+                self._pending = None
+            if pending is None:
+                return
+
+            version, d = pending
+            try:
+                with self.db.transaction() as db:
+                    cur = db.execute(
+                        "UPDATE state SET version = ?, data = ? WHERE id = 0 "
+                        "AND EXISTS (SELECT 1 FROM lease "
+                        "            WHERE name = ? AND holder = ?)",
+                        (version, json.dumps(d), LEADER_LEASE, self.holder)
+                    )
+                    written: bool = cur.rowcount > 0
+            except Exception:
+                # keep it for the next flush, unless a newer one came in.
+                with self._cond:
+                    if self._pending is None:
+                        self._pending = pending
+                raise
+            if not written:
+                logger.error(f"not the leader, dropped state v{version}")
+
+    def close(self) -> None:
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+
+def load_state(gstate: GlobalState) -> None:
+
+    store: StateStore = app.state.store
+    d: Optional[Dict[str, Any]] = store.load()
+    if d is not None:
         gstate.load(d)
 
 
 def _write_state(gstate: GlobalState) -> None:
-    d = gstate.dump()
+    store: StateStore = app.state.store
+    store.update(gstate.dump())
 
-    with open(os.path.join(CONF_PATH, "state.json"), "w") as fd:
-        json.dump(d, fd)   
 
+# -------------- dashboard client --------------
+#
+# long-lived https session to the ceph dashboard. Connections are kept alive
+# and pooled, so consecutive api calls don't pay a tcp + tls handshake each.
+#
+def _jwt_expiry(token: str) -> Optional[float]:
+    """ Obtain the 'exp' claim from a JWT, without validating it. """
+    try:
+        payload: str = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims["exp"])
+    except Exception:
+        return None
+
+
+class TokenManager:
+    """
+    Hands out the dashboard token kept in gstate, refreshing it shortly
+    before it expires. Refreshes are serialized, so concurrent callers
+    holding the same stale token share a single auth round trip.
+    """
+
+    def __init__(
+        self,
+        gstate: GlobalState,
+        fetch: Callable[[], str],
+        margin: float = TOKEN_REFRESH_MARGIN
+    ) -> None:
+        self.gstate = gstate
+        self.refreshes: int = 0
+        self._fetch = fetch
+        self._margin = margin
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, token: str) -> bool:
+        if not token:
+            return False
+        exp: Optional[float] = _jwt_expiry(token)
+        if exp is None:
+            # no expiry we can read; keep it until the dashboard says no.
+            return True
+        return time.time() < exp - self._margin
+
+    def get(self) -> str:
+        token: str = self.gstate.token
+        if self._is_fresh(token):
+            return token
+        return self.refresh(token)
+
+    def refresh(self, stale: str) -> str:
+        """ Replace 'stale', unless someone else already did meanwhile. """
+        with self._lock:
+            token: str = self.gstate.token
+            if token != stale and self._is_fresh(token):
+                return token
+
+            token = self._fetch()
+            if not token:
+                raise Exception("unable to refresh token")
+            self.gstate.token = token
+            self.refreshes += 1
+            return token
+
+
+class DashboardClient:
+
+    def __init__(
+        self,
+        gstate: GlobalState,
+        pool_size: int = DASHBOARD_POOL_SIZE,
+        connect_timeout: float = DASHBOARD_CONNECT_TIMEOUT,
+        read_timeout: float = DASHBOARD_READ_TIMEOUT,
+        latency: Optional[Histogram] = None
+    ) -> None:
+        self.gstate = gstate
+        self.latency = latency
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.tokens = TokenManager(gstate, self._fetch_token)
+
+        # the dashboard runs on a single host, so one connection pool is
+        # enough; block when all connections are busy instead of opening
+        # throwaway ones.
+        self._adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True
+        )
+        self._session = requests.Session()
+        self._session.mount("https://", self._adapter)
 
-def _get_headers(
-    gstate: GlobalState, _authenticated: bool
-) -> Dict[str, Any]:
+    def endpoint(self, ep: str) -> str:
+        return f"https://{self.gstate.host}:{self.gstate.port}/api/{ep}"
 
-    _headers: Dict[str, str] = {
-        "Accept": "application/vnd.ceph.api.v1.0+json",
-        "Content-Type": "application/json"
-    }
-    if _authenticated:
-        token: str = _obtain_token(gstate)
-        _headers["Authorization"] = f"Bearer {token}"
-    return _headers
+    def headers(self, token: Optional[str] = None) -> Dict[str, Any]:
+
+        _headers: Dict[str, str] = {
+            "Accept": "application/vnd.ceph.api.v1.0+json",
+            "Content-Type": "application/json"
+        }
+        if token is not None:
+            _headers["Authorization"] = f"Bearer {token}"
+        return _headers
+
+    def _fetch_token(self) -> str:
+        _payload: Dict[str, str] = {
+            "username": self.gstate.username,
+            "password": self.gstate.password
+        }
+        res = self.post("auth", _payload, False)
+        if "token" not in res:
+            raise Exception("error obtaining Token")
+        return res["token"]
+
+    def _request(
+        self,
+        method: str,
+        endpoint: str,
+        _authenticated: bool,
+        **kwargs: Any
+    ) -> requests.Response:
+
+        ep: str = self.endpoint(endpoint)
+        token: Optional[str] = \
+            self.tokens.get() if _authenticated else None
+        start: float = time.monotonic()
+        try:
+            req = self._session.request(
+                method, ep, headers=self.headers(token),
+                timeout=self.timeout, verify=False, **kwargs
+            )
+            if req.status_code == 401 and _authenticated:
+                # token was revoked or expired early; refresh once and retry.
+                assert token is not None
+                logger.info(f"unauthorized on {ep}, refreshing token")
+                token = self.tokens.refresh(token)
+                req = self._session.request(
+                    method, ep, headers=self.headers(token),
+                    timeout=self.timeout, verify=False, **kwargs
+                )
+        finally:
+            if self.latency is not None:
+                self.latency.observe(
+                    time.monotonic() - start, method, endpoint
+                )
+        return req
+
+    def post(
+        self,
+        endpoint: str,
+        _payload: Dict[str, Any],
+        _authenticated: bool = True
+    ) -> Any:
+
+        try:
+            req = self._request("POST", endpoint, _authenticated,
+                                json=_payload)
+            return req.json()
+        except Exception as e:
+            print(f"error on post > ep: {endpoint}, "
+                  f"payload: {str(_payload)}")
+            raise e
+
+    def put(
+        self,
+        endpoint: str,
+        _payload: Dict[str, Any],
+        _authenticated: bool = True
+    ) -> Any:
+
+        try:
+            req = self._request("PUT", endpoint, _authenticated,
+                                json=_payload)
+            req.raise_for_status()
+            return req.json() if req.content else None
+        except Exception as e:
+            print(f"error on put > ep: {endpoint}, "
+                  f"payload: {str(_payload)}")
+            raise e
+
+    def get(
+        self,
+        endpoint: str,
+        _parameters: Dict[str, Any],
+        _authenticated: bool = True
+    ) -> Any:
 
+        try:
+            req = self._request("GET", endpoint, _authenticated,
+                                params=_parameters)
+            return req.json()
+        except Exception as e:
+            print(f"error on get > ep: {endpoint}, "
+                  f"params: {str(_parameters)}")
+            raise e
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """ Connection reuse per pool; 'new' connections paid a handshake. """
+
+        pools: Dict[str, Any] = {}
+        manager = self._adapter.poolmanager
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            new: int = pool.num_connections
+            total: int = pool.num_requests
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "requests": total,
+                "new_connections": new,
+                "reused_connections": max(total - new, 0),
+                "idle_connections": pool.pool.qsize() if pool.pool else 0,
+                "max_connections": self.pool_size
+            }
+        return pools
+
+    def close(self) -> None:
+        self._session.close()
+
+
+class AsyncDashboardClient:
+    """
+    Awaitable counterpart to DashboardClient, for the api handlers. Calls
+    share the sync client's connection pool and token, but run on a
+    dedicated executor sized to that pool, so a slow mgr neither blocks the
+    event loop nor starves the executor running background jobs.
+    """
+
+    def __init__(self, client: DashboardClient) -> None:
+        self.client = client
+        self._executor = ThreadPoolExecutor(
+            max_workers=client.pool_size,
+            thread_name_prefix="dashboard"
+        )
+
+    async def _run(self, func: Callable, *args: Any) -> Any:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args)
+        )
+
+    async def post(
+        self,
+        endpoint: str,
+        _payload: Dict[str, Any],
+        _authenticated: bool = True
+    ) -> Any:
+        return await self._run(
+            self.client.post, endpoint, _payload, _authenticated
+        )
+
+    async def get(
+        self,
+        endpoint: str,
+        _parameters: Dict[str, Any],
+        _authenticated: bool = True
+    ) -> Any:
+        return await self._run(
+            self.client.get, endpoint, _parameters, _authenticated
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
 
-def _get_endpoint(gstate: GlobalState, ep: str) -> str:
-    return f"https://{gstate.host}:{gstate.port}/api/{ep}"
 
 def _post(
     gstate: GlobalState,
     endpoint: str,
     _payload: Dict[str, Any],
     _authenticated: bool = True
-) -> Dict[str, Any]:
+) -> Any:
+    client: DashboardClient = app.state.dashboard
+    return client.post(endpoint, _payload, _authenticated)
 
-    ep: str = _get_endpoint(gstate, endpoint)
-    _headers: Dict[str, Any] = _get_headers(gstate, _authenticated)    
-    
-    try:
-        req = requests.post(ep, json=_payload, headers=_headers, verify=False)
-        return req.json()
-    except Exception as e:
-        print(f"error on post > ep: {ep}, "
-              f"payload: {str(_payload)}, headers: {str(_headers)}")
-        raise e
+
+def _put(
+    gstate: GlobalState,
+    endpoint: str,
+    _payload: Dict[str, Any],
+    _authenticated: bool = True
+) -> Any:
+    client: DashboardClient = app.state.dashboard
+    return client.put(endpoint, _payload, _authenticated)
 
 
 def _get(
@@ -181,76 +1009,235 @@ def _get(
     endpoint: str,
     _parameters: Dict[str, Any],
     _authenticated: bool = True
-) -> Dict[str, Any]:
+) -> Any:
+    client: DashboardClient = app.state.dashboard
+    return client.get(endpoint, _parameters, _authenticated)
 
-    ep: str = _get_endpoint(gstate, endpoint)
-    _headers: Dict[str, Any] = _get_headers(gstate, _authenticated)    
 
-    try:
-        req = requests.get(ep, params=_parameters,
-                           headers=_headers, verify=False)
-        return req.json()
-    except Exception as e:
-        print(f"error on get > ep: {ep}, "
-              f"params: {str(_parameters)}, headers: {str(_headers)}")
-        raise e
+async def _aget(
+    gstate: GlobalState,
+    endpoint: str,
+    _parameters: Dict[str, Any],
+    _authenticated: bool = True
+) -> Any:
+    client: AsyncDashboardClient = app.state.dashboard_async
+    return await client.get(endpoint, _parameters, _authenticated)
 
 
 def _obtain_token(gstate: GlobalState) -> str:
+    """ Authenticate anew, regardless of any token we may be holding. """
+    client: DashboardClient = app.state.dashboard
+    return client._fetch_token()
 
-    _payload: Dict[str, str] = {
-        "username": gstate.username,
-        "password": gstate.password
+
+def _config_str(value: Any) -> str:
+    """ How ceph reports a config value we set. """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _get_config(gstate: GlobalState, names: List[str]) -> Dict[str, str]:
+    """ Current global values for 'names', in a single request. """
+
+    res = _get(gstate, "cluster_conf/filter", {"names": ",".join(names)})
+    values: Dict[str, str] = {}
+    for opt in res:
+        for v in opt.get("value", []):
+            if v["section"] == "global":
+                values[opt["name"]] = str(v["value"]).lower()
+    return values
+
+
+def _apply_config(
+    gstate: GlobalState,
+    options: Dict[str, Any]
+) -> Dict[str, str]:
+    """
+    Set global config options in one batch, leaving alone the ones already
+    set as wanted. Returns each option's outcome: 'unchanged', 'applied' or
+    'failed'.
+    """
+
+    names: List[str] = list(options.keys())
+    wanted: Dict[str, str] = {
+        name: _config_str(value).lower() for name, value in options.items()
     }
-    res = _post(gstate, "auth", _payload, False)
-    if "token" not in res:
-        raise Exception("error obtaining Token")
+    current: Dict[str, str] = _get_config(gstate, names)
+
+    result: Dict[str, str] = {}
+    changes: Dict[str, Any] = {}
+    for name in names:
+        if current.get(name) == wanted[name]:
+            result[name] = "unchanged"
+        else:
+            changes[name] = {
+                "section": "global",
+                "value": _config_str(options[name])
+            }
+
+    if len(changes) == 0:
+        return result
+
+    try:
+        _put(gstate, "cluster_conf", {"options": changes})
+    except Exception as e:
+        logger.error("error applying config: " + str(e))
+
+    current = _get_config(gstate, list(changes.keys()))
+    for name in changes.keys():
+        ok: bool = current.get(name) == wanted[name]
+        result[name] = "applied" if ok else "failed"
+    return result
+
+
+def wait_for(
+    what: str,
+    predicate: Callable[[], bool],
+    deadline: float = WAIT_DEADLINE,
+    initial: float = WAIT_INITIAL_INTERVAL,
+    maximum: float = WAIT_MAX_INTERVAL
+) -> bool:
+    """
+    Probe 'predicate' until it holds or 'deadline' seconds elapse, backing
+    off exponentially (with jitter) from 'initial' up to 'maximum' seconds
+    between probes. Returns whether the predicate held.
+    """
+
+    start: float = time.monotonic()
+    interval: float = initial
+    attempts: int = 0
+    while True:
+        attempts += 1
+        if predicate():
+            logger.info(f"{what}: done after {attempts} probes, "
+                        f"{time.monotonic() - start:.1f}s")
+            return True
 
-    # print("token > " + res["token"])
-    # print(f"===> TOKEN <===\n{str(res)}")
+        remaining: float = deadline - (time.monotonic() - start)
+        if remaining <= 0:
+            logger.error(f"{what}: timed out after {deadline}s")
+            return False
 
-    return res["token"]
+        delay: float = interval / 2 + random.uniform(0, interval / 2)
+        time.sleep(min(delay, remaining))
+        interval = min(interval * 2, maximum)
 
 
-def _set_config(gstate: GlobalState, name: str, value: Any) -> None:
+def _get_health(gstate: GlobalState) -> Dict[str, Any]:
+    res = _get(gstate, "health/minimal", {})
+    if "health" not in res:
+        raise Exception("unexpected health format")
+    return res
 
-    _opt = { "name": name, "value": [{"section": "global", "value": value }]}
+
+def _cluster_ready(gstate: GlobalState, num_osds: int) -> bool:
+    """ Health is okay and at least 'num_osds' osds, all of them up and in. """
+    res = _get_health(gstate)
+    osds: List[Dict[str, Any]] = res.get("osd_map", {}).get("osds", [])
+    if len(osds) < max(num_osds, 1):
+        return False
+    if not all(osd["up"] and osd["in"] for osd in osds):
+        return False
+    return res["health"]["status"] == "HEALTH_OK"
+
+
+# -------------- provisioning steps --------------
+#
+# each phase is a graph of steps. A step runs once the steps it requires are
+# done; completed steps are checkpointed in gstate, so a restarted phase
+# picks up where it left off.
+#
+class Step(NamedTuple):
+    name: str
+    func: Callable[[GlobalState], None]
+    requires: Tuple[str, ...] = ()
+    checkpoint: bool = True     # if False, always runs again on resume
+
+
+def _run_step(gstate: GlobalState, step: Step) -> None:
+
+    metrics: Metrics = app.state.metrics
+    # one series per kind of step, not per nfs export.
+    kind: str = step.name.split(".")[0]
+
+    logger.info(f"step {step.name}: start")
+    gstate.record_step(step.name, status="running", start=time.time(),
+                       end=None, error=None)
+    _write_state(gstate)
+    start: float = time.monotonic()
     try:
-        _post(gstate, "cluster_conf", _opt)
+        step.func(gstate)
     except Exception as e:
-        logger.error("error: " + str(e))
+        logger.error(f"step {step.name}: error: {str(e)}")
+        metrics.steps.observe(time.monotonic() - start, kind, "error")
+        gstate.record_step(step.name, status="error", end=time.time(),
+                           error=str(e))
+        _write_state(gstate)
         raise e
 
+    metrics.steps.observe(time.monotonic() - start, kind, "done")
+    gstate.record_step(step.name, status="done", end=time.time())
+    _write_state(gstate)
+    logger.info(f"step {step.name}: done")
+
 
-def _wait_health_okay(gstate: GlobalState) -> None:
+def run_steps(
+    gstate: GlobalState,
+    steps: List[Step],
+    workers: int = STEP_WORKERS
+) -> None:
+    """
+    Run the steps not yet done, each as soon as its requirements are, with
+    up to 'workers' at a time. Stops scheduling on the first failure and,
+    once the running steps are over, raises it.
+    """
+
+    done: List[str] = [
+        step.name for step in steps
+        if step.checkpoint and gstate.step_done(step.name)
+    ]
+    pending: List[Step] = [step for step in steps if step.name not in done]
+    running: Dict[Future, Step] = {}
+    failure: Optional[BaseException] = None
 
-    timeout = 300   # 5 minutes
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while len(running) > 0 or (len(pending) > 0 and failure is None):
+            if failure is None:
+                for step in [s for s in pending
+                             if all(r in done for r in s.requires)]:
+                    pending.remove(step)
+                    running[executor.submit(_run_step, gstate, step)] = step
 
-    import time
-    start = time.time()
+            if len(running) == 0:
+                # what's left requires steps that aren't in this graph.
+                raise Exception("unable to run steps: " +
+                                str([step.name for step in pending]))
 
-    while True:
-        now = time.time()
-        if now - start >= timeout:
-            logger.error("timeout reached waiting for health okay!")
-            gstate.state = State.PROVISION_ERROR
-            break
+            finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                if future.exception() is None:
+                    done.append(step.name)
+                    _report_progress(len(done), len(steps), step.name)
+                elif failure is None:
+                    failure = future.exception()
 
-        # for testing purposes only
-        res = _get(gstate, "task", {})
-        logger.info("===> tasks result: " + str(res))
-        print("-----> TASKS result: " + str(res))
+    if failure is not None:
+        raise failure
 
-        res = _get(gstate, "health/minimal", {})
-        if "health" not in res:
-            raise Exception("unexpected health format")
 
-        if res["health"]["status"] == "HEALTH_OK":
-            break
+def _step_timeline(gstate: GlobalState) -> List[Dict[str, Any]]:
 
-        time.sleep(10)
+    with gstate._steps_lock:
+        steps = [dict(rec, name=name) for name, rec in gstate.steps.items()]
+
+    for step in steps:
+        step["duration"] = None
+        if step.get("start") and step.get("end"):
+            step["duration"] = step["end"] - step["start"]
+    return sorted(steps, key=lambda step: step.get("start") or 0)
 
-    pass
 
 # -------------- initial phase --------------
 #
@@ -262,22 +1249,20 @@ def do_start(gstate: GlobalState) -> None:
 
     logger.info("start bootstrapping")
 
-    if gstate.state == State.CHOOSE_OPERATION:
-        do_bootstrap(gstate)
-
-    if gstate.state == State.BOOTSTRAP_END or \
-       gstate.state == State.AUTH_START:
-        do_authentication(gstate)
+    run_steps(gstate, [
+        Step("bootstrap", do_bootstrap),
+        Step("authenticate", do_authentication, ("bootstrap",)),
+        # inventory is always refreshed on restart; from cache, or anew.
+        Step("inventory", do_obtain_inventory, ("authenticate",),
+             checkpoint=False),
+    ])
 
-    if gstate.state == State.AUTH_END or \
-       gstate.state == State.INVENTORY_START:
-        do_obtain_inventory(gstate)
 
-    return
+BOOTSTRAP_PASSWORD = "bootstrapPW"
 
 
 def _change_bootstrap_password(gstate: GlobalState) -> str:
-    new_passwd: str = "bootstrapPW"
+    new_passwd: str = BOOTSTRAP_PASSWORD
     _payload: Dict[str, str] = {
         "old_password": gstate.password,
         "new_password": new_passwd
@@ -287,72 +1272,361 @@ def _change_bootstrap_password(gstate: GlobalState) -> str:
     return new_passwd
 
 
+def _device_class(device: Dict[str, Any]) -> str:
+    if device["path"].startswith("/dev/nvme"):
+        return "nvme"
+    if str(device["sys_api"].get("rotational", "1")) == "0":
+        return "ssd"
+    return "hdd"
+
+
+def _drive_group(n: int, **spec: Any) -> Dict[str, Any]:
+    return dict({
+        "service_type": "osd",
+        "service_id": f"bootstrap-drive-group-{n}",
+        "host_pattern": "*"
+    }, **spec)
+
+
+def _flash_osds_groups(
+    n: int,
+    nvme: List[Dict[str, Any]],
+    ssd: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """ Drive groups for standalone flash osds, splitting nvme devices. """
+    groups: List[Dict[str, Any]] = []
+    if len(nvme) > 0:
+        groups.append(_drive_group(
+            n + len(groups),
+            data_devices={ "paths": [d["path"] for d in nvme] },
+            osds_per_device=NVME_OSDS_PER_DEVICE
+        ))
+    if len(ssd) > 0:
+        groups.append(_drive_group(
+            n + len(groups),
+            data_devices={ "paths": [d["path"] for d in ssd] }
+        ))
+    return groups
+
+
+def _flash_iops(nvme: List[Dict[str, Any]], ssd: List[Dict[str, Any]]) -> float:
+    return len(nvme) * MEDIA_IOPS["nvme"] * NVME_SPLIT_SPEEDUP + \
+        len(ssd) * MEDIA_IOPS["ssd"]
+
+
+def _plan_layouts(devices: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Candidate osd layouts over the available devices, before replication:
+    raw data capacity, relative io, and the drive groups to create them.
+    """
+
+    hdd = [d for d in devices if d["class"] == "hdd"]
+    ssd = [d for d in devices if d["class"] == "ssd"]
+    nvme = [d for d in devices if d["class"] == "nvme"]
+    flash = nvme + ssd
+
+    def _size(devs: List[Dict[str, Any]]) -> int:
+        return sum(d["size"] for d in devs)
+
+    layouts: List[Dict[str, Any]] = []
+
+    # every device is an osd of its own.
+    groups: List[Dict[str, Any]] = []
+    if len(hdd) > 0:
+        groups.append(_drive_group(
+            0, data_devices={ "paths": [d["path"] for d in hdd] }
+        ))
+    groups += _flash_osds_groups(len(groups), nvme, ssd)
+    layouts.append({
+        "layout": "standalone",
+        "label": "every device as an osd",
+        "data_devices": len(devices),
+        "size": _size(devices),
+        "iops": len(hdd) * MEDIA_IOPS["hdd"] + _flash_iops(nvme, ssd),
+        "num_osds": len(hdd) + len(ssd) + len(nvme) * NVME_OSDS_PER_DEVICE,
+        "metadata_tier": False,
+        "drive_groups": groups
+    })
+
+    if len(hdd) > 0 and len(flash) > 0:
+        # hdds hold the data, flash takes their rocksdb and wal.
+        layouts.append({
+            "layout": "hybrid",
+            "label": "hdd data, db/wal on flash",
+            "data_devices": len(hdd),
+            "size": _size(hdd),
+            "iops": len(hdd) * MEDIA_IOPS["hdd"] * DB_ON_FLASH_SPEEDUP,
+            "num_osds": len(hdd),
+            "metadata_tier": False,
+            "drive_groups": [_drive_group(
+                0,
+                data_devices={ "paths": [d["path"] for d in hdd] },
+                db_devices={ "paths": [d["path"] for d in flash] }
+            )]
+        })
+
+        # hdds hold the data, flash osds hold the filesystem metadata.
+        layouts.append({
+            "layout": "tiered",
+            "label": "hdd data, flash metadata tier",
+            "data_devices": min(len(hdd), len(flash)),
+            "size": _size(hdd),
+            "metadata_size": _size(flash),
+            "iops": len(hdd) * MEDIA_IOPS["hdd"] + _flash_iops(nvme, ssd),
+            "num_osds": len(hdd) + len(ssd) + \
+                len(nvme) * NVME_OSDS_PER_DEVICE,
+            "metadata_tier": True,
+            "drive_groups": [_drive_group(
+                0, data_devices={ "paths": [d["path"] for d in hdd] }
+            )] + _flash_osds_groups(1, nvme, ssd)
+        })
+
+    return layouts
+
+
+def _merge_layouts(
+    per_host: Dict[str, List[Dict[str, Any]]],
+    pin_hosts: bool
+) -> List[Dict[str, Any]]:
+    """
+    Cluster-wide layouts out of per-host ones. A layout is offered only if
+    every host with devices can use it; each host gets its own drive groups,
+    pinned to it if 'pin_hosts'.
+    """
+
+    if len(per_host) == 0:
+        return _plan_layouts([])
+
+    hosts: List[str] = sorted(per_host.keys())
+    names: List[str] = [
+        layout["layout"] for layout in per_host[hosts[0]]
+        if all(
+            any(other["layout"] == layout["layout"] for other in per_host[h])
+            for h in hosts
+        )
+    ]
+
+    merged: List[Dict[str, Any]] = []
+    for name in names:
+        parts: List[Dict[str, Any]] = [
+            next(lo for lo in per_host[host] if lo["layout"] == name)
+            for host in hosts
+        ]
+        groups: List[Dict[str, Any]] = []
+        for host, part in zip(hosts, parts):
+            for group in part["drive_groups"]:
+                groups.append(dict(
+                    group,
+                    service_id=f"bootstrap-drive-group-{len(groups)}",
+                    host_pattern=host if pin_hosts else "*"
+                ))
+        layout: Dict[str, Any] = {
+            "layout": name,
+            "label": parts[0]["label"],
+            "data_devices": sum(p["data_devices"] for p in parts),
+            "data_hosts": len([p for p in parts if p["data_devices"] > 0]),
+            "size": sum(p["size"] for p in parts),
+            "iops": sum(p["iops"] for p in parts),
+            "num_osds": sum(p["num_osds"] for p in parts),
+            "metadata_tier": parts[0]["metadata_tier"],
+            "failure_domain": "host" if len(hosts) > 1 else "osd",
+            "drive_groups": groups
+        }
+        if "metadata_size" in parts[0]:
+            layout["metadata_size"] = sum(p["metadata_size"] for p in parts)
+        merged.append(layout)
+
+    return merged
+
+
 def _calc_storage_solutions(
-    inventory: Dict[str, Any]
+    hosts: Dict[str, Dict[str, Any]]
 ) -> Dict[str, Any]:
-
-    if "devices" not in inventory:
-        return {}
-
-    class Device:
-        available: bool
-        path: str
-        size: int
-        type: str
-        pass
-
-    devices: List[Device] = []
-    for device in inventory["devices"]:
-        dev = Device()
-        dev.available = device["available"]
-        dev.path = device["path"]
-        dev.size = device["sys_api"]["size"]
-        dev.type = device["human_readable_type"]
-        devices.append(dev)
-
-    class Solution:
-        can_raid0: bool
-        can_raid1: bool
-        raid0_size: float
-        raid1_size: float
-
-    available_devices = [dev for dev in devices if dev.available]
-    storage_total = sum([dev.size for dev in available_devices])
-    solution = Solution()
-    solution.can_raid0 = (len(available_devices) > 0)
-    solution.raid0_size = storage_total if solution.can_raid0 else 0
-    solution.can_raid1 = (len(available_devices) >= 2)
-    solution.raid1_size = (storage_total / 2.0) if solution.can_raid1 else 0
+    """ Storage plans over the inventories of all hosts, by host name. """
+
+    devices: List[Dict[str, Any]] = []
+    per_host: Dict[str, List[Dict[str, Any]]] = {}
+    for host, inventory in hosts.items():
+        host_devices: List[Dict[str, Any]] = []
+        for device in inventory.get("devices", []):
+            host_devices.append({
+                "host": host,
+                "available": device["available"],
+                "path": device["path"],
+                "size": device["sys_api"]["size"],
+                "type": device["human_readable_type"],
+                "class": _device_class(device)
+            })
+        devices += host_devices
+
+        available_devices = [dev for dev in host_devices if dev["available"]]
+        if len(available_devices) > 0:
+            per_host[host] = _plan_layouts(available_devices)
+
+    plans: List[Dict[str, Any]] = []
+    for layout in _merge_layouts(per_host, len(hosts) > 1):
+        for replicas in PLAN_REPLICAS:
+            plan = dict(layout)
+            plan["name"] = f"{layout['layout']}-r{replicas}"
+            plan["label"] = f"{layout['label']}, {replicas}x replicated"
+            plan["replicas"] = replicas
+            # each replica in a different failure domain.
+            domains: int = layout["data_devices"] \
+                if layout.get("failure_domain", "osd") == "osd" \
+                else layout["data_hosts"]
+            plan["available"] = domains >= replicas
+            plan["size"] = layout["size"] / replicas
+            if "metadata_size" in layout:
+                plan["metadata_size"] = layout["metadata_size"] / replicas
+            # relative to a single, unreplicated hdd.
+            plan["relative_iops"] = layout["iops"] / replicas
+            del plan["iops"], plan["data_devices"]
+            plan.pop("data_hosts", None)
+            plans.append(plan)
 
     result: Dict[str, Any] = {
-        "solution": solution.__dict__,
-        "devices": [d.__dict__ for d in devices]
+        "hosts": sorted(hosts.keys()),
+        "plans": plans,
+        "devices": devices
     }
 
     return result
 
 
+def _device_fingerprint() -> str:
+    """
+    Cheap digest of the local block devices: names, sizes, serials, and
+    whatever sits on top of them. Changes whenever the inventory might.
+    """
+
+    devices: List[str] = []
+    for dev in sorted(os.listdir("/sys/block")):
+        if dev.startswith("dm"):
+            continue
+        base: str = os.path.join("/sys/block", dev)
+        size: str = cephadm.read_file([os.path.join(base, "size")])
+        serial: str = cephadm.read_file([
+            os.path.join(base, "device", "serial"),
+            os.path.join(base, "device", "wwid"),
+            os.path.join(base, "serial")
+        ])
+        holders: List[str] = sorted(os.listdir(os.path.join(base, "holders")))
+        parts: List[str] = sorted(
+            p for p in os.listdir(base) if p.startswith(dev)
+        )
+        devices.append(f"{dev}:{size}:{serial}:{holders}:{parts}")
+
+    return hashlib.sha1("\n".join(devices).encode("utf-8")).hexdigest()
+
+
+def _inventory_cache_path() -> str:
+    return os.path.join(CONF_PATH, "inventory.json")
+
+
+def _read_inventory_cache() -> Optional[Dict[str, Any]]:
+    path: str = _inventory_cache_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as fd:
+            d = json.load(fd)
+        assert isinstance(d, dict)
+        assert "fingerprint" in d and "hosts" in d
+        return d
+    except Exception as e:
+        logger.error("ignoring inventory cache: " + str(e))
+        return None
+
+
+def _write_inventory_cache(
+    fingerprint: str,
+    hosts: Dict[str, Dict[str, Any]]
+) -> None:
+    path: str = _inventory_cache_path()
+    tmp: str = f"{path}.tmp"
+    with open(tmp, "w") as fd:
+        json.dump({ "fingerprint": fingerprint, "hosts": hosts }, fd)
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.rename(tmp, path)
+
+
+def _list_hosts(gstate: GlobalState) -> List[str]:
+    """ Hosts managed by the orchestrator, i.e. those with an inventory. """
+
+    res = _get(gstate, "orchestrator/status", {}, True)
+    print("--- orchestrator status: " + str(res))
+    if not res.get("available", False):
+        raise Exception("orchestrator not available: " +
+                        str(res.get("message")))
+
+    res = _get(gstate, "host", {}, True)
+    hosts: List[str] = sorted(
+        host["hostname"] for host in res
+        if host.get("sources", {}).get("orchestrator", True)
+    )
+    if len(hosts) == 0:
+        hosts = ["localhost"]
+    return hosts
+
+
+def _fetch_inventory(
+    gstate: GlobalState,
+    hosts: List[str],
+    workers: int = INVENTORY_WORKERS
+) -> Dict[str, Dict[str, Any]]:
+    """ Inventories of 'hosts', fetched concurrently. """
+
+    def _fetch_host(host: str) -> Dict[str, Any]:
+        res = _get(gstate, f"host/{host}/inventory", {}, True)
+        print(f"--- inventory {host}: " + str(res))
+        return res
+
+    with ThreadPoolExecutor(
+        max_workers=max(min(workers, len(hosts)), 1),
+        thread_name_prefix="inventory"
+    ) as executor:
+        return dict(zip(hosts, executor.map(_fetch_host, hosts)))
+
+
 def do_obtain_inventory(gstate: GlobalState) -> None:
 
     assert gstate.state == State.AUTH_END or \
-           gstate.state == State.INVENTORY_START
+           gstate.state == State.INVENTORY_START or \
+           gstate.state == State.INVENTORY_WAIT
 
     assert gstate.token != ""
 
     gstate.state = State.INVENTORY_START
     # _write_state(gstate) # don't save state, always call on restart
 
-    res = _get(gstate, "orchestrator/status", {}, True)
-    print("--- orchestrator status: " + str(res))
+    fingerprint: str = _device_fingerprint()
+    cached: Optional[Dict[str, Any]] = _read_inventory_cache()
+    if cached is not None and cached["fingerprint"] != fingerprint:
+        cached = None   # our devices changed, its paths may be gone.
+    if cached is not None:
+        # serve what we had right away; the devices may not have changed.
+        gstate.inventory = _calc_storage_solutions(cached["hosts"])
+        gstate.state = State.INVENTORY_WAIT
+        # the other workers serve and accept plans off the shared state.
+        _write_state(gstate)
+
+    hosts: List[str] = _list_hosts(gstate)
+    if cached is not None and len(hosts) == 1 and \
+       sorted(cached["hosts"].keys()) == hosts:
+        logger.info("devices unchanged, using cached inventory")
+        return
+    # we can only fingerprint our own devices; other hosts are re-fetched.
+    logger.info(f"refreshing inventory of {len(hosts)} host(s)")
 
-    host: str = "localhost"  # this should be programatically obtained
-    ep: str = f"host/{host}/inventory"
-    res = _get(gstate, ep, {}, True)
-    print("--- inventory: " + str(res))
+    res = _fetch_inventory(gstate, hosts)
+    _write_inventory_cache(fingerprint, res)
     gstate.inventory = _calc_storage_solutions(res)
     print("--- solution: " + str(gstate.inventory))
 
-    gstate.state = State.INVENTORY_WAIT  # wait for user input
+    if gstate.state == State.INVENTORY_START:
+        gstate.state = State.INVENTORY_WAIT  # wait for user input
+    _write_state(gstate)
 
 
 def do_authentication(gstate: GlobalState) -> None:
@@ -370,27 +1644,34 @@ def do_authentication(gstate: GlobalState) -> None:
     gstate.token = token
     _write_state(gstate)
 
-    new_passwd: str = _change_bootstrap_password(gstate)
-    gstate.password = new_passwd
-    _write_state(gstate)
+    # we may be resuming after having changed it already.
+    if gstate.password != BOOTSTRAP_PASSWORD:
+        new_passwd: str = _change_bootstrap_password(gstate)
+        gstate.password = new_passwd
+        _write_state(gstate)
+
+        token: str = _obtain_token(gstate)
+        if not token:
+            raise Exception("unable to obtain token again")
+        gstate.token = token
 
-    token: str = _obtain_token(gstate)
-    if not token:
-        raise Exception("unable to obtain token again")
-    gstate.token = token
     gstate.state = State.AUTH_END
     _write_state(gstate)
 
 
 def do_bootstrap(gstate: GlobalState) -> None:
 
+    if gstate.fsid != "":
+        logger.info(f"already bootstrapped cluster {gstate.fsid}")
+        return
+
     gstate.state = State.BOOTSTRAP_START
     _write_state(gstate)
 
     try:
         ctx = cephadm.cephadm_init("check-host".split())
         if not ctx:
-            return None
+            raise Exception("unable to create context for check-host")
 
         logger.info("has context for check-host")
         host = cephadm.HostFacts(ctx)
@@ -413,13 +1694,13 @@ def do_bootstrap(gstate: GlobalState) -> None:
             if netmask_idx > 0:
                 selected = selected[:netmask_idx]
         else:
-            return None
+            raise Exception("no address to bootstrap on")
 
         logger.info("prepare bootstrap")
         ctx = cephadm.cephadm_init(
             f"--verbose bootstrap --skip-prepare-host --mon-ip {selected}".split())
         if not ctx:
-            return None
+            raise Exception("unable to create context for bootstrap")
 
         logger.info("bootstrap!")
         bootstrap_info = cephadm.cephadm_bootstrap(ctx)
@@ -450,19 +1731,28 @@ def do_bootstrap(gstate: GlobalState) -> None:
 #
 # user has selected the storage solution, prepare osds and create pools.
 #
+def _find_plan(
+    gstate: GlobalState,
+    solution_name: str
+) -> Optional[Dict[str, Any]]:
+    for plan in gstate.inventory.get("plans", []):
+        if plan["name"] == solution_name and plan["available"]:
+            return plan
+    return None
+
+
 def do_select_solution(gstate: GlobalState, solution_name: str) -> None:
     print("===> do solution: " + solution_name)
 
-    poolsize: int = 1
-    if solution_name == "raid1":
-        poolsize = 2
-    elif solution_name != "raid0":
+    plan: Optional[Dict[str, Any]] = _find_plan(gstate, solution_name)
+    if plan is None:
         raise Exception(f"unknown solution {solution_name}")
 
+    gstate.plan = plan
     gstate.state = State.INVENTORY_END
     _write_state(gstate)
 
-    do_provision(gstate, poolsize)
+    do_provision(gstate, plan["replicas"])
 
 
 def do_provision(gstate: GlobalState, poolsize: int) -> None:
@@ -470,8 +1760,19 @@ def do_provision(gstate: GlobalState, poolsize: int) -> None:
     gstate.state = State.PROVISION_START
     _write_state(gstate)
 
-    _setup_config(gstate, poolsize)
-    _create_osds(gstate)
+    try:
+        run_steps(gstate, [
+            Step("config", lambda g: _setup_config(g, poolsize)),
+            # pools created along with the osds must see the default size.
+            Step("osds", _create_osds, ("config",)),
+        ])
+    except Exception:
+        gstate.state = State.PROVISION_ERROR
+        _write_state(gstate)
+        raise
+    finally:
+        # no more ceph commands until services are set up, if ever.
+        app.state.ceph_shells.drain()
 
     gstate.state = State.PROVISION_END
     _write_state(gstate)
@@ -481,28 +1782,44 @@ def do_provision(gstate: GlobalState, poolsize: int) -> None:
 
 def _setup_config(gstate: GlobalState, poolsize: int) -> None:
 
+    options: Dict[str, Any] = {}
     if poolsize == 1:
-        _set_config(gstate, "mon_allow_pool_size_one", True)
-        _set_config(gstate, "mon_warn_on_pool_no_redundancy", False)
+        options["mon_allow_pool_size_one"] = True
+        options["mon_warn_on_pool_no_redundancy"] = False
+
+    options["osd_pool_default_size"] = poolsize
+    options["osd_pool_default_min_size"] = 1
+
+    if gstate.plan.get("failure_domain", "host") == "osd":
+        # the default rule wants each replica on its own host, and the
+        # crush map already exists, so osd_crush_chooseleaf_type won't do.
+        options["osd_pool_default_crush_rule"] = _osd_crush_rule()
+
+    result: Dict[str, str] = _apply_config(gstate, options)
+    logger.info("config: " + str(result))
+    failed: List[str] = [
+        name for name, outcome in result.items() if outcome == "failed"
+    ]
+    if len(failed) > 0:
+        raise Exception(f"unable to set config options {failed}")
 
-    _set_config(gstate, "osd_pool_default_size", poolsize)
-    _set_config(gstate, "osd_pool_default_min_size", 1)
 
-    pass
+def _osd_crush_rule() -> int:
+    """ A replicated rule over osds, taken by the pools there are already. """
+
+    _ceph_shell("osd crush rule create-replicated "
+                f"{OSD_CRUSH_RULE} default osd")
+    rule: Dict[str, Any] = \
+        _ceph_shell_json(f"osd crush rule dump {OSD_CRUSH_RULE}")
+    for pool in _ceph_shell_json("osd pool ls"):
+        _ceph_shell(f"osd pool set {pool} crush_rule {OSD_CRUSH_RULE}")
+    return rule["rule_id"]
 
 
 def _create_osds(gstate: GlobalState) -> None:
 
-    _drive_groups: List[Dict[str, Any]] = [
-        {
-            "service_type": "osd",
-            "service_id": "bootstrap-drive-group",
-            "host_pattern": "*",
-            "data_devices": {
-                "all": True
-            }
-        }
-    ]
+    assert len(gstate.plan) > 0
+    _drive_groups: List[Dict[str, Any]] = gstate.plan["drive_groups"]
 
     _payload: Dict[str, Any] = {
         "method": "drive_groups",
@@ -513,9 +1830,10 @@ def _create_osds(gstate: GlobalState) -> None:
     res = _post(gstate, "osd", _payload, True)
     logger.info(res)
 
-    _wait_health_okay(gstate)
-
-    pass
+    num_osds: int = gstate.plan["num_osds"]
+    if not wait_for("osds up and in",
+                    lambda: _cluster_ready(gstate, num_osds)):
+        raise Exception("osds not up and in")
 
 # -------------- third phase / service creation --------------
 #
@@ -530,90 +1848,1448 @@ def _service_prepare(gstate: GlobalState):
     _write_state(gstate)
 
 
+class CephShellResult(NamedTuple):
+    stdout: str
+    stderr: str
+    retcode: int
+
+
+class CephShell:
+    """
+    A privileged, long-running container with the mounts 'cephadm shell'
+    would use, idling until ceph commands are exec'ed into it.
+    """
+
+    def __init__(
+        self,
+        ctx: cephadm.CephadmContext,
+        template: cephadm.CephContainer,
+        slot: int
+    ) -> None:
+        self.ctx = ctx
+        self.slot = slot
+        self.name = f"rlyeh-ceph-shell-{slot}"
+        self.uses: int = 0
+        self.broken: bool = False
+        self.last_check: float = 0.0
+        self._container = copy.copy(template)
+        self._container.cname = self.name
+        self._container.entrypoint = "sleep"
+        self._container.args = ["infinity"]
+
+    def start(self) -> None:
+        # a previous incarnation may have outlived us.
+        self.stop()
+        cmd: List[str] = self._container.run_cmd()
+        cmd.insert(cmd.index("run") + 1, "--detach")
+        cephadm.call_throws(self.ctx, cmd)
+        self.last_check = time.monotonic()
+
+    def stop(self) -> None:
+        cephadm.call(self.ctx, [self.ctx.container_path, "rm", "-f", self.name],
+                     verbose_on_failure=False)
+
+    def healthy(self) -> bool:
+        out, _, ret = cephadm.call(
+            self.ctx,
+            [self.ctx.container_path, "inspect",
+             "--format", "{{.State.Running}}", self.name],
+            verbose_on_failure=False
+        )
+        self.last_check = time.monotonic()
+        return ret == 0 and out.strip() == "true"
+
+    def run(self, args: List[str], timeout: int) -> CephShellResult:
+        self.uses += 1
+        out, err, ret = cephadm.call(
+            self.ctx,
+            [self.ctx.container_path, "exec", self.name, "ceph"] + args,
+            desc="ceph",
+            timeout=timeout
+        )
+        # 125-127 come from the container runtime, not from ceph.
+        if ret in (125, 126, 127):
+            self.broken = True
+        else:
+            self.last_check = time.monotonic()
+        return CephShellResult(out, err, ret)
+
+
+class CephShellPool:
+    """
+    Up to 'size' CephShell containers, started on demand and reused across
+    commands. Containers idle for a while are checked before reuse, and
+    recycled after 'max_uses' commands.
+    """
+
+    def __init__(
+        self,
+        size: int = CEPH_SHELL_POOL_SIZE,
+        max_uses: int = CEPH_SHELL_MAX_USES
+    ) -> None:
+        self.size = size
+        self.max_uses = max_uses
+        self.started: int = 0
+        self._ctx: Optional[cephadm.CephadmContext] = None
+        self._template: Optional[cephadm.CephContainer] = None
+        self._template_lock = threading.Lock()
+        self._idle: List[CephShell] = []
+        self._free_slots: List[int] = list(range(size))
+        self._closed: bool = False
+        self._cond = threading.Condition()
+
+    def _get_template(
+        self
+    ) -> Tuple[cephadm.CephadmContext, cephadm.CephContainer]:
+        """ Work out the shell's mounts and image, once. """
+        with self._template_lock:
+            if self._ctx is None or self._template is None:
+                with _cephadm_lock:
+                    ctx = cephadm.cephadm_init("shell -- ceph".split())
+                if not ctx:
+                    raise Exception("unable to create context for ceph shell")
+                self._template = cephadm.get_shell_container(ctx)
+                self._ctx = ctx
+            return self._ctx, self._template
+
+    def _acquire(self) -> CephShell:
+        while True:
+            shell: Optional[CephShell] = None
+            slot: int = -1
+            with self._cond:
+                while not self._closed and len(self._idle) == 0 and \
+                      len(self._free_slots) == 0:
+                    self._cond.wait()
+                if self._closed:
+                    raise Exception("ceph shell pool is closed")
+                if len(self._idle) > 0:
+                    shell = self._idle.pop()
+                else:
+                    slot = self._free_slots.pop()
+
+            if shell is not None:
+                if time.monotonic() - shell.last_check < CEPH_SHELL_CHECK_AGE \
+                   or shell.healthy():
+                    return shell
+                logger.info(f"ceph shell {shell.name} gone, replacing")
+                self._discard(shell)
+                continue
+
+            try:
+                ctx, template = self._get_template()
+                shell = CephShell(ctx, template, slot)
+                shell.start()
+            except Exception:
+                with self._cond:
+                    self._free_slots.append(slot)
+                    self._cond.notify()
+                raise
+            self.started += 1
+            return shell
+
+    def _discard(self, shell: CephShell) -> None:
+        shell.stop()
+        with self._cond:
+            self._free_slots.append(shell.slot)
+            self._cond.notify()
+
+    def _release(self, shell: CephShell) -> None:
+        with self._cond:
+            if not self._closed and not shell.broken and \
+               shell.uses < self.max_uses:
+                self._idle.append(shell)
+                self._cond.notify()
+                return
+        self._discard(shell)
+
+    def run(
+        self,
+        cmd: str,
+        timeout: int = CEPH_SHELL_TIMEOUT
+    ) -> CephShellResult:
+        shell: CephShell = self._acquire()
+        try:
+            return shell.run(shlex.split(cmd), timeout)
+        finally:
+            self._release(shell)
+
+    def drain(self) -> None:
+        """ Stop the idle shells; the pool starts new ones on demand. """
+        with self._cond:
+            idle: List[CephShell] = self._idle
+            self._idle = []
+        for shell in idle:
+            self._discard(shell)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle: List[CephShell] = self._idle
+            self._idle = []
+            self._cond.notify_all()
+        for shell in idle:
+            self._discard(shell)
+
+
+_cephadm_lock = threading.Lock()
+
+
+def _ceph_shell(cmd: str) -> None:
+    """ Run a ceph command in a pooled ceph shell, raising if it fails. """
+
+    shells: CephShellPool = app.state.ceph_shells
+    res: CephShellResult = shells.run(cmd)
+    if res.retcode != 0:
+        raise Exception(f"'ceph {cmd}' failed with {res.retcode}: "
+                        f"{res.stderr.strip()}")
+
+
+def _ceph_shell_json(cmd: str) -> Any:
+    """ Run a ceph command in a pooled ceph shell, returning its json. """
+
+    shells: CephShellPool = app.state.ceph_shells
+    res: CephShellResult = shells.run(f"{cmd} --format json")
+    if res.retcode != 0:
+        raise Exception(f"'ceph {cmd}' failed with {res.retcode}: "
+                        f"{res.stderr.strip()}")
+    return json.loads(res.stdout)
+
+
+def _fold_flash_classes() -> None:
+    """
+    Ceph puts nvme-backed osds in the "nvme" device class, and a crush rule
+    takes a single class; move them to "ssd" so that the metadata rule
+    spans every flash osd.
+    """
+
+    if "nvme" not in _ceph_shell_json("osd crush class ls"):
+        return
+    osds: List[int] = _ceph_shell_json("osd crush class ls-osd nvme")
+    if len(osds) == 0:
+        return
+    names: str = " ".join(f"osd.{osd}" for osd in osds)
+    _ceph_shell(f"osd crush rm-device-class {names}")
+    _ceph_shell(f"osd crush set-device-class ssd {names}")
+
+
+def _mds_active(gstate: GlobalState, name: str) -> bool:
+    for fs in _get(gstate, "cephfs", {}):
+        mdsmap: Dict[str, Any] = fs["mdsmap"]
+        if mdsmap["fs_name"] != name:
+            continue
+        return any(
+            mds["state"] == "up:active" for mds in mdsmap["info"].values()
+        )
+    return False
+
+
+def _nfs_running(gstate: GlobalState, clusterid: str) -> bool:
+    return any(
+        daemon["cluster_id"] == clusterid and daemon["status"] == 1
+        for daemon in _get(gstate, "nfs-ganesha/daemon", {})
+    )
+
+
+def _setup_tiers(gstate: GlobalState) -> None:
+    """ Crush rules for the tiered layout, shared by every volume. """
+
+    domain: str = gstate.plan.get("failure_domain", "osd")
+    _fold_flash_classes()
+    _ceph_shell("osd crush rule create-replicated "
+                f"{METADATA_CRUSH_RULE} default {domain} ssd")
+    _ceph_shell("osd crush rule create-replicated "
+                f"{DATA_CRUSH_RULE} default {domain} hdd")
+
+
+def _setup_nfs(
+    gstate: GlobalState,
+    name: str,
+    exports: List[NFSExportItem]
+) -> None:
+    """ Volume, mds, nfs cluster and exports for a single cephfs volume. """
+
+    clusterid: str = f"{name}-nfs"
+
+    _ceph_shell(f"fs volume create {name}")
+    if gstate.plan.get("metadata_tier", False):
+        # metadata on the flash osds, data on the hdds; see _setup_tiers.
+        _ceph_shell(f"osd pool set cephfs.{name}.meta "
+                    f"crush_rule {METADATA_CRUSH_RULE}")
+        _ceph_shell(f"osd pool set cephfs.{name}.data "
+                    f"crush_rule {DATA_CRUSH_RULE}")
+    # 'fs volume create' doesn't always get the mds daemons going.
+    _ceph_shell(f"orch apply mds {name}")
+    if not wait_for(f"mds for {name}", lambda: _mds_active(gstate, name)):
+        raise Exception(f"mds for {name} not active")
+
+    _ceph_shell(f"nfs cluster create cephfs {clusterid}")
+    if not wait_for(f"nfs cluster {clusterid}",
+                    lambda: _nfs_running(gstate, clusterid)):
+        raise Exception(f"nfs cluster {clusterid} not running")
+
+    for export in exports:
+        # binding and path come from the user; keep them one argument each.
+        cmd: str = f"nfs export create cephfs {name} {clusterid} " + \
+            shlex.quote(export.binding)
+        if export.readonly:
+            cmd += " --readonly"
+        if export.path != "/":
+            cmd += " " + shlex.quote(f"--path={export.path}")
+        _ceph_shell(cmd)
+
+
 def do_services(gstate: GlobalState, desc: ServiceDescriptorItem):
-    assert gstate.state == State.SERVICE_WAIT
-    assert len(desc.nfs_name) > 0
+    assert gstate.state == State.SERVICE_WAIT or \
+           gstate.state == State.SERVICE_START
 
+    by_name: Dict[str, List[NFSExportItem]] = {}
+    for export in desc.all_exports():
+        by_name.setdefault(export.name, []).append(export)
+    assert len(by_name) > 0
+
+    gstate.services = desc.dict()
     gstate.state = State.SERVICE_START
     _write_state(gstate)
 
-    for name in desc.nfs_name:
-        create_ctx = cephadm.cephadm_init(
-            f"--verbose shell -- ceph fs volume create {name}".split()
-        )        
-        if not create_ctx:
-            logger.error(f"unable to create context for nfs {name}")
-            print("==> ERROR: unable to get ctx")
+    steps: List[Step] = []
+    requires: Tuple[str, ...] = ()
+    if gstate.plan.get("metadata_tier", False):
+        # once, before any volume; folding classes under a running
+        # 'crush rule create' makes it fail.
+        steps.append(Step("tiers", _setup_tiers))
+        requires = ("tiers",)
+    steps += [
+        Step(f"nfs.{name}",
+             functools.partial(_setup_nfs, name=name, exports=exports),
+             requires)
+        for name, exports in by_name.items()
+    ]
+    try:
+        run_steps(gstate, steps, workers=SERVICE_WORKERS)
+    except Exception:
+        gstate.state = State.SERVICE_ERROR
+        _write_state(gstate)
+        raise
+    finally:
+        app.state.ceph_shells.drain()
+
+    gstate.state = State.SERVICE_END
+    _write_state(gstate)
+
+    gstate.state = State.READY
+    _write_state(gstate)
+
+
+# -------------- cluster stats --------------
+#
+# snapshots of cluster usage, as served to the dashboards.
+#
+def _calc_df(
+    nfs: List[Dict[str, Any]],
+    pools: List[Dict[str, Any]],
+    health: Dict[str, Any]
+) -> StatsItem:
+
+    nfs_poolname_to_clusterid = {}
+    cephfs_pools = []
+    for export in nfs:
+        fsname = export["fsal"]["fs_name"]
+        poolname = f"cephfs.{fsname}.data"
+        cephfs_pools.append(poolname)
+        nfs_poolname_to_clusterid[poolname] = export["cluster_id"]
+
+    nfs_pools = {}
+    for pool in pools:
+        poolname = pool["pool_name"]
+        if cephfs_pools.count(poolname) > 0:
+            clusterid = nfs_poolname_to_clusterid[poolname]
+            nfs_pools[clusterid] = {
+                "used": pool["stats"]["bytes_used"]["latest"],
+                "percent_used": pool["stats"]["percent_used"]["latest"],
+                "avail": pool["stats"]["max_avail"]["latest"],
+                "avail_raw": pool["stats"]["avail_raw"]["latest"]
+            }
+
+    df = health["df"]["stats"]
+    stats: StatsItem = StatsItem(
+        total_avail_bytes=df["total_avail_bytes"],
+        total_raw_bytes=df["total_bytes"],
+        total_used_raw_bytes=df["total_used_raw_bytes"],
+        pools=nfs_pools
+    )
+    return stats
+
+
+class ClusterSnapshot(NamedTuple):
+    """ What the cluster looked like at 'stamp'; never modified once built. """
+    stamp: float
+    exports: Tuple[Dict[str, Any], ...]
+    pools: Tuple[Dict[str, Any], ...]
+    health: Dict[str, Any]
+    stats: StatsItem
+    etag: str
+
+
+class ClusterPoller:
+    """
+    Refreshes exports, pool stats and health from the dashboard every
+    'interval' seconds, so handlers serve from memory instead of waiting on
+    the mgr. Listeners are called with each new snapshot.
+
+    With a 'coordinator', only the leader asks the dashboard and shares its
+    snapshots through the state db; the other workers pick them up from
+    there, so every worker serves the same snapshot.
+    """
+
+    def __init__(
+        self,
+        gstate: GlobalState,
+        coordinator: Optional["WorkerCoordinator"] = None,
+        interval: float = POLLER_INTERVAL
+    ) -> None:
+        self.gstate = gstate
+        self.coordinator = coordinator
+        self.interval = interval
+        self.snapshot: Optional[ClusterSnapshot] = None
+        self.failures: int = 0
+        self.consecutive_failures: int = 0
+        self.last_error: str = ""
+        self._listeners: List[Callable[[ClusterSnapshot], None]] = []
+        self._task: Optional[asyncio.Future] = None
+        self._refreshed = asyncio.Event()
+
+    def add_listener(
+        self, listener: Callable[[ClusterSnapshot], None]
+    ) -> None:
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        if self._task is None:
+            logger.info("starting cluster poller")
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            if self.coordinator is None or self.coordinator.leader:
+                await self.refresh()
+            else:
+                await self.follow()
+            await asyncio.sleep(self.interval)
+
+    def _failed(self, e: Exception) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = str(e)
+        logger.error("error refreshing cluster snapshot: " + str(e))
+
+    def _publish(self, snapshot: ClusterSnapshot) -> None:
+        self.snapshot = snapshot
+        self.consecutive_failures = 0
+        self._refreshed.set()
+
+        for listener in self._listeners:
+            listener(snapshot)
+
+    def _share(self, snapshot: ClusterSnapshot) -> None:
+        """ Hand the snapshot to the other workers, while still leading. """
+        assert self.coordinator is not None
+        d: Dict[str, Any] = {
+            "exports": list(snapshot.exports),
+            "pools": list(snapshot.pools),
+            "health": snapshot.health,
+            "stats": snapshot.stats.dict(),
+            "etag": snapshot.etag
+        }
+        with self.coordinator.store.db.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO snapshot (id, stamp, data) "
+                "SELECT 0, ?, ? WHERE EXISTS (SELECT 1 FROM lease "
+                "                             WHERE name = ? AND holder = ?)",
+                (snapshot.stamp, json.dumps(d), LEADER_LEASE,
+                 self.coordinator.holder)
+            )
+
+    def _load_shared(self, seen: float) -> Optional[ClusterSnapshot]:
+        """ The shared snapshot, unless it's still the one from 'seen'. """
+        assert self.coordinator is not None
+        row = self.coordinator.store.db.get().execute(
+            "SELECT stamp, data FROM snapshot WHERE id = 0 AND stamp != ?",
+            (seen,)
+        ).fetchone()
+        if row is None:
             return None
-        
+        d: Dict[str, Any] = json.loads(row[1])
+        return ClusterSnapshot(
+            stamp=row[0],
+            exports=tuple(d["exports"]),
+            pools=tuple(d["pools"]),
+            health=d["health"],
+            stats=StatsItem(**d["stats"]),
+            etag=d["etag"]
+        )
+
+    async def follow(self) -> None:
+        """ Take the leader's latest snapshot, if there's a newer one. """
+        seen: float = self.snapshot.stamp if self.snapshot is not None else 0.0
         try:
-            cephadm.command_shell(create_ctx)
+            snapshot: Optional[ClusterSnapshot] = \
+                await run_in_threadpool(self._load_shared, seen)
         except Exception as e:
-            print("===> ERROR: " + str(e))
-            logger.error("---> ERROR: " + str(e))
-            return None
+            self._failed(e)
+            return
+        if snapshot is not None:
+            self._publish(snapshot)
 
-    # XXX: nasty hack to work around some weird behavior with
-    # 'fs volume create' not starting/creating the mds daemons.
-    import time
-    time.sleep(10)
-
-    for name in desc.nfs_name:
-        apply_ctx = cephadm.cephadm_init(
-            f"--verbose shell -- ceph orch apply mds {name}".split()
-        )
-        assert apply_ctx
+    async def refresh(self) -> None:
+        gstate: GlobalState = self.gstate
         try:
-            cephadm.command_shell(apply_ctx)
+            exports, pools, health = await asyncio.gather(
+                _aget(gstate, "nfs-ganesha/export", {}),
+                _aget(gstate, "pool", {"stats": True}),
+                _aget(gstate, "health/minimal", {})
+            )
+            stats: StatsItem = _calc_df(exports, pools, health)
         except Exception as e:
-            print("===> ERROR: " + str(e))
-            logger.error("---> ERROR: " + str(e))
-            raise e
+            self._failed(e)
+            return
+
+        digest: str = hashlib.sha1(stats.json().encode("utf-8")).hexdigest()
+        snapshot = ClusterSnapshot(
+            stamp=time.time(),
+            exports=tuple(exports),
+            pools=tuple(pools),
+            health=health,
+            stats=stats,
+            etag=f'"{digest}"'
+        )
+        if self.coordinator is not None:
+            try:
+                await run_in_threadpool(self._share, snapshot)
+            except Exception as e:
+                logger.error("unable to share cluster snapshot: " + str(e))
+        self._publish(snapshot)
+
+    async def get(self) -> ClusterSnapshot:
+        """ The latest snapshot, waiting a bit for the first one if needed. """
+        if self.snapshot is None:
+            self.start()
+            try:
+                await asyncio.wait_for(
+                    self._refreshed.wait(), POLLER_WAIT_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                raise HTTPException(503, "cluster stats not available yet")
+        assert self.snapshot is not None
+        return self.snapshot
+
+    def status(self) -> Dict[str, Any]:
+        age: Optional[float] = None
+        if self.snapshot is not None:
+            age = time.time() - self.snapshot.stamp
+        return {
+            "running": self._task is not None,
+            "source": "dashboard"
+            if self.coordinator is None or self.coordinator.leader
+            else "leader",
+            "interval": self.interval,
+            "last_refresh_age": age,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error
+        }
 
-    # XXX: wait for mds cluster to stabilize
-    time.sleep(10)
 
-    for name in desc.nfs_name:
-        nfs_create_ctx = cephadm.cephadm_init(
-            f"shell -- ceph nfs cluster create cephfs {name}-nfs".split()
-        )
-        assert nfs_create_ctx
+# -------------- usage history --------------
+#
+# per-pool and cluster-wide usage over time, kept in fixed-size ring buffers
+# at a few resolutions, so memory stays bounded regardless of uptime.
+#
+class UsageTier:
+    """
+    Ring buffer of (timestamp, used, avail) samples, one per 'step' seconds.
+    Samples falling into the same step are averaged.
+    """
+
+    def __init__(self, step: int, size: int) -> None:
+        self.step = step
+        self.size = size
+        self._stamps = array("d", [0.0]) * size
+        self._used = array("d", [0.0]) * size
+        self._avail = array("d", [0.0]) * size
+        self._head: int = 0     # next slot to write
+        self._count: int = 0
+        # partially filled step
+        self._bucket: float = -1.0
+        self._sum_used: float = 0.0
+        self._sum_avail: float = 0.0
+        self._num: int = 0
+
+    def add(self, stamp: float, used: float, avail: float) -> None:
+        bucket: float = stamp - (stamp % self.step)
+        if bucket != self._bucket:
+            self._flush()
+            self._bucket = bucket
+        self._sum_used += used
+        self._sum_avail += avail
+        self._num += 1
+
+    def _push(self, stamp: float, used: float, avail: float) -> None:
+        self._stamps[self._head] = stamp
+        self._used[self._head] = used
+        self._avail[self._head] = avail
+        self._head = (self._head + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def _flush(self) -> None:
+        if self._num == 0:
+            return
+        self._push(self._bucket,
+                   self._sum_used / self._num,
+                   self._sum_avail / self._num)
+        self._sum_used = self._sum_avail = 0.0
+        self._num = 0
+
+    def current(self) -> Optional[Tuple[float, float, float]]:
+        """ The step being filled, averaged so far. """
+        if self._num == 0:
+            return None
+        return (self._bucket,
+                self._sum_used / self._num,
+                self._sum_avail / self._num)
+
+    def points(self) -> List[Tuple[float, float, float]]:
+        """ Oldest first, including the step still being filled. """
+        start: int = (self._head - self._count) % self.size
+        result: List[Tuple[float, float, float]] = []
+        for n in range(self._count):
+            idx = (start + n) % self.size
+            result.append(
+                (self._stamps[idx], self._used[idx], self._avail[idx])
+            )
+        current = self.current()
+        if current is not None:
+            result.append(current)
+        return result
+
+    def dump(self) -> Dict[str, Any]:
+
+        def _encode(a: array) -> str:
+            return base64.b64encode(a.tobytes()).decode("ascii")
+
+        return {
+            "step": self.step,
+            "size": self.size,
+            "head": self._head,
+            "count": self._count,
+            "stamps": _encode(self._stamps),
+            "used": _encode(self._used),
+            "avail": _encode(self._avail),
+            "pending": [self._bucket, self._sum_used,
+                        self._sum_avail, self._num]
+        }
+
+    def load(self, d: Dict[str, Any]) -> None:
+        if d["step"] != self.step or d["size"] != self.size:
+            return  # tier layout changed; start over.
+
+        def _decode(s: str) -> array:
+            a = array("d")
+            a.frombytes(base64.b64decode(s))
+            assert len(a) == self.size
+            return a
+
+        self._stamps = _decode(d["stamps"])
+        self._used = _decode(d["used"])
+        self._avail = _decode(d["avail"])
+        self._head = d["head"]
+        self._count = d["count"]
+        (self._bucket, self._sum_used,
+         self._sum_avail, self._num) = d["pending"]
+
+
+class UsageSeries:
+
+    def __init__(self, tiers: List[Tuple[int, int]]) -> None:
+        self.tiers: List[UsageTier] = [
+            UsageTier(step, size) for step, size in tiers
+        ]
+        self.last_update: float = 0.0
+
+    def add(self, stamp: float, used: float, avail: float) -> None:
+        for tier in self.tiers:
+            tier.add(stamp, used, avail)
+        self.last_update = stamp
+
+    def tier(self, step: Optional[int]) -> Optional[UsageTier]:
+        if step is None:
+            return self.tiers[0]
+        for tier in self.tiers:
+            if tier.step == step:
+                return tier
+        return None
+
+
+def _downsample(
+    points: List[Tuple[float, float, float]],
+    num: int
+) -> List[Tuple[float, float, float]]:
+    """ Average consecutive points so at most 'num' are left. """
+
+    if num <= 0 or len(points) <= num:
+        return points
+    per: int = math.ceil(len(points) / num)
+    result: List[Tuple[float, float, float]] = []
+    for i in range(0, len(points), per):
+        chunk = points[i:i + per]
+        result.append((
+            chunk[-1][0],
+            sum(p[1] for p in chunk) / len(chunk),
+            sum(p[2] for p in chunk) / len(chunk)
+        ))
+    return result
+
+
+def _fill_rate(points: List[Tuple[float, float, float]]) -> Optional[float]:
+    """ Least-squares rate at which available space shrinks, in bytes/s. """
+
+    if len(points) < 2:
+        return None
+    n: int = len(points)
+    mean_t: float = sum(p[0] for p in points) / n
+    mean_a: float = sum(p[2] for p in points) / n
+    var: float = sum((p[0] - mean_t) ** 2 for p in points)
+    if var == 0:
+        return None
+    cov: float = sum((p[0] - mean_t) * (p[2] - mean_a) for p in points)
+    return -(cov / var)
+
+
+def _usage_item(
+    name: str,
+    step: int,
+    points: List[Tuple[float, float, float]],
+    num: int
+) -> UsageHistoryItem:
+
+    fill_rate: Optional[float] = _fill_rate(points)
+    time_to_full: Optional[float] = None
+    if fill_rate is not None and fill_rate > 0:
+        time_to_full = points[-1][2] / fill_rate
+
+    return UsageHistoryItem(
+        series=name,
+        resolution=step,
+        points=_downsample(points, num),
+        fill_rate=fill_rate,
+        time_to_full=time_to_full
+    )
+
+
+class UsageHistory:
+    """
+    Usage series for the cluster ('total') and for each nfs pool, fed from
+    the cluster poller's snapshots and periodically saved to 'path'. Each
+    sample is also mirrored to the shared database, where workers that
+    don't record history themselves read it from.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        db: Optional[SharedDB] = None,
+        tiers: List[Tuple[int, int]] = HISTORY_TIERS
+    ) -> None:
+        self.path = path
+        self.db = db
+        self._tiers = tiers
+        self._series: Dict[str, UsageSeries] = {}
+        self._lock = threading.Lock()
+        self._saved: float = time.monotonic()
+
+    def _get_series(self, name: str) -> Optional[UsageSeries]:
+        if name not in self._series:
+            if len(self._series) >= HISTORY_MAX_SERIES + 1:
+                self._expire()
+            if len(self._series) >= HISTORY_MAX_SERIES + 1:
+                return None
+            self._series[name] = UsageSeries(self._tiers)
+        return self._series[name]
+
+    def _expire(self) -> None:
+        """ Forget series not updated for longer than we keep history. """
+        span: int = max(step * size for step, size in self._tiers)
+        horizon: float = time.time() - span
+        for name in [n for n, series in self._series.items()
+                     if series.last_update < horizon]:
+            del self._series[name]
+
+    def record(self, snapshot: ClusterSnapshot) -> None:
+        stats: StatsItem = snapshot.stats
+        samples: Dict[str, Tuple[float, float]] = {
+            "total": (stats.total_used_raw_bytes, stats.total_avail_bytes)
+        }
+        for name, pool in stats.pools.items():
+            samples[name] = (pool.used, pool.avail)
+
+        rows: List[Tuple[str, int, float, float, float]] = []
+        with self._lock:
+            for name, (used, avail) in samples.items():
+                series = self._get_series(name)
+                if series is None:
+                    continue
+                series.add(snapshot.stamp, used, avail)
+                for tier in series.tiers:
+                    current = tier.current()
+                    if current is not None:
+                        rows.append((name, tier.step) + current)
+
+        loop = asyncio.get_event_loop()
+        if self.db is not None:
+            loop.run_in_executor(app.state.executor, self._share, rows)
+        if time.monotonic() - self._saved >= HISTORY_SAVE_INTERVAL:
+            self._saved = time.monotonic()
+            loop.run_in_executor(app.state.executor, self.save)
+
+    def _share(self, rows: List[Tuple[str, int, float, float, float]]) -> None:
+        """ Upsert the steps being filled, and drop the ones aged out. """
+        assert self.db is not None
+        now: float = time.time()
         try:
-            cephadm.command_shell(nfs_create_ctx)
+            with self.db.transaction() as db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO usage "
+                    "(series, step, stamp, used, avail) "
+                    "VALUES (?, ?, ?, ?, ?)", rows
+                )
+                for step, size in self._tiers:
+                    db.execute(
+                        "DELETE FROM usage WHERE step = ? AND stamp < ?",
+                        (step, now - step * size)
+                    )
         except Exception as e:
-            print("===> ERROR: " + str(e))
-            logger.error("---> ERROR: " + str(e))
-            raise e
+            logger.error("unable to share usage history: " + str(e))
+
+    def query(
+        self,
+        name: str,
+        step: Optional[int],
+        num: int
+    ) -> Optional[UsageHistoryItem]:
+
+        with self._lock:
+            series = self._series.get(name)
+            tier = series.tier(step) if series is not None else None
+            if tier is None:
+                return None
+            points = tier.points()
+
+        return _usage_item(name, tier.step, points, num)
+
+    def query_shared(
+        self,
+        name: str,
+        step: Optional[int],
+        num: int
+    ) -> Optional[UsageHistoryItem]:
+        """ Like query(), out of what the recording worker shared. """
+
+        assert self.db is not None
+        steps: List[int] = [tier_step for tier_step, _ in self._tiers]
+        if step is None:
+            step = steps[0]
+        elif step not in steps:
+            return None
+        points: List[Tuple[float, float, float]] = [
+            (row[0], row[1], row[2]) for row in self.db.get().execute(
+                "SELECT stamp, used, avail FROM usage "
+                "WHERE series = ? AND step = ? ORDER BY stamp",
+                (name, step)
+            )
+        ]
+        if len(points) == 0:
+            return None
+        return _usage_item(name, step, points, num)
+
+    def save(self) -> None:
+        with self._lock:
+            d: Dict[str, Any] = {
+                name: {
+                    "last_update": series.last_update,
+                    "tiers": [tier.dump() for tier in series.tiers]
+                }
+                for name, series in self._series.items()
+            }
+        tmp: str = f"{self.path}.tmp"
+        with open(tmp, "w") as fd:
+            json.dump(d, fd)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.rename(tmp, self.path)
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as fd:
+                d = json.load(fd)
+            assert isinstance(d, dict)
+            for name, raw in d.items():
+                series = UsageSeries(self._tiers)
+                series.last_update = raw["last_update"]
+                for tier, raw_tier in zip(series.tiers, raw["tiers"]):
+                    tier.load(raw_tier)
+                self._series[name] = series
+        except Exception as e:
+            logger.error("unable to load usage history: " + str(e))
+            self._series = {}
 
-    # XXX: wait for nfs cluster
-    time.sleep(10)
 
-    for name in desc.nfs_name:
-        nfs_export_ctx = cephadm.cephadm_init(
-            f"shell -- ceph nfs export create cephfs {name} {name}-nfs /cephfs".split()
+# -------------- event stream --------------
+#
+# state transitions and stats changes, pushed to the dashboards as
+# server-sent events.
+#
+class Event(NamedTuple):
+    id: int
+    kind: str
+    data: str
+
+
+class EventBroker:
+    """
+    Fans events out to every subscribed stream. Keeps a bounded backlog so
+    reconnecting clients can resume from their last seen event id, and the
+    latest event of each kind for clients that can't.
+
+    Event ids are prefixed with the broker's 'origin': a client reconnecting
+    to another worker, or to a restarted one, presents an id from elsewhere
+    and gets the latest of each kind instead of a bogus resume.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        backlog: int = EVENT_BACKLOG,
+        origin: Optional[str] = None
+    ) -> None:
+        self._loop = loop
+        self.origin: str = origin if origin is not None else uuid.uuid4().hex
+        self._seq: int = 0
+        self._backlog: Deque[Event] = deque(maxlen=backlog)
+        self._latest: Dict[str, Event] = {}
+        self._subscribers: List[asyncio.Queue] = []
+
+    def publish(self, kind: str, data: Any) -> None:
+        """ Thread-safe; the event is dispatched from the event loop. """
+        self._loop.call_soon_threadsafe(
+            self._dispatch, kind, json.dumps(data)
         )
-        assert nfs_export_ctx
+
+    def _dispatch(self, kind: str, data: str) -> None:
+        self._seq += 1
+        event = Event(self._seq, kind, data)
+        self._backlog.append(event)
+        self._latest[kind] = event
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def event_id(self, event: Event) -> str:
+        return f"{self.origin}.{event.id}"
+
+    def _seq_of(self, event_id: Optional[str]) -> Optional[int]:
+        """ The sequence number of one of our event ids, None otherwise. """
+        if event_id is None:
+            return None
+        origin, _, seq = event_id.rpartition(".")
+        if origin != self.origin or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def subscribe(
+        self, last_event_id: Optional[str]
+    ) -> Tuple[asyncio.Queue, List[Event]]:
+        """ Returns the subscriber's queue, and the events it missed. """
+
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+
+        last_id: Optional[int] = self._seq_of(last_event_id)
+        if last_id is not None and last_id <= self._seq and \
+           len(self._backlog) > 0 and self._backlog[0].id <= last_id + 1:
+            missed = [ev for ev in self._backlog if ev.id > last_id]
+        else:
+            missed = sorted(self._latest.values(), key=lambda ev: ev.id)
+        return queue, missed
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+
+def _format_event(broker: EventBroker, event: Event) -> str:
+    return f"id: {broker.event_id(event)}\n" \
+           f"event: {event.kind}\ndata: {event.data}\n\n"
+
+
+def _publish_df_changes(broker: EventBroker) -> Callable:
+    """ Snapshot listener pushing df to the streams, only when it changed. """
+
+    last_etag: Optional[str] = None
+
+    def _on_snapshot(snapshot: ClusterSnapshot) -> None:
+        nonlocal last_etag
+        if snapshot.etag != last_etag:
+            last_etag = snapshot.etag
+            broker.publish("df", snapshot.stats.dict())
+
+    return _on_snapshot
+
+
+# -------------- background jobs --------------
+#
+# long operations run as jobs: each gets an id, identical submissions share
+# the job already in flight, and each kind of job has its own concurrency
+# cap on top of the executor's.
+#
+class Job:
+
+    def __init__(self, kind: str, key: str, func: Callable, *args: Any):
+        self.id: str = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.func = func
+        self.args = args
+        self.status: str = "queued"     # running, done, error
+        self.submitted: float = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.progress: Optional[Dict[str, Any]] = None
+        # serializes the listener's calls, so the last one sees the latest
+        # state even when they race.
+        self.notify_lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ["queued", "running"]
+
+    def dump(self) -> Dict[str, Any]:
+        duration: Optional[float] = None
+        if self.started is not None:
+            duration = (self.finished or time.time()) - self.started
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "duration": duration,
+            "error": self.error,
+            "progress": self.progress
+        }
+
+
+class JobManager:
+
+    def __init__(
+        self,
+        executor: ThreadPoolExecutor,
+        limits: Dict[str, int] = JOB_LIMITS,
+        history: int = JOB_HISTORY,
+        listener: Optional[Callable[[Job], None]] = None
+    ) -> None:
+        self._executor = executor
+        self._limits = limits
+        self._history = history
+        self._listener = listener
+        self._jobs: Dict[str, Job] = {}     # in submission order
+        self._inflight: Dict[str, Job] = {}  # by key
+        self._pending: Dict[str, Deque[Job]] = {}
+        self._running: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def submit(
+        self,
+        kind: str,
+        func: Callable,
+        *args: Any,
+        key: Optional[str] = None
+    ) -> Job:
+        """
+        Queue 'func(*args)' as a job of 'kind'. While a job with the same
+        key (by default, its kind) is queued or running, that job is
+        returned instead of a new one.
+        """
+        key = key if key is not None else kind
+        with self._lock:
+            existing: Optional[Job] = self._inflight.get(key)
+            if existing is not None:
+                logger.info(f"job {kind}: joining {existing.id}")
+                return existing
+
+            job = Job(kind, key, func, *args)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self._pending.setdefault(kind, deque()).append(job)
+            self._expire()
+            self._dispatch(kind)
+        # the listener may write to disk; don't hold up other jobs meanwhile.
+        self._notify(job)
+        return job
+
+    def fail(self, kind: str, error: str) -> Job:
+        """ Record a job of 'kind' that was refused before running. """
+        job = Job(kind, kind, lambda: None)
+        job.status = "error"
+        job.error = error
+        job.finished = time.time()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._expire()
+        self._notify(job)
+        return job
+
+    def _notify(self, job: Job) -> None:
+        if self._listener is None:
+            return
         try:
-            cephadm.command_shell(nfs_export_ctx)
+            with job.notify_lock:
+                self._listener(job)
         except Exception as e:
-            print("===> ERROR: " + str(e))
-            logger.error("---> ERROR: " + str(e))
-            raise e
+            logger.error(f"job {job.id}: listener failed: {str(e)}")
+
+    def _dispatch(self, kind: str) -> None:
+        """ Start what the kind's cap allows; with the lock held. """
+        limit: int = self._limits.get(kind, 1)
+        pending: Deque[Job] = self._pending.get(kind, deque())
+        while len(pending) > 0 and self._running.get(kind, 0) < limit:
+            job = pending.popleft()
+            self._running[kind] = self._running.get(kind, 0) + 1
+            self._executor.submit(self._run, job)
+
+    def _expire(self) -> None:
+        """ Drop the oldest finished jobs; with the lock held. """
+        finished = [job for job in self._jobs.values() if not job.active]
+        for job in finished[:max(len(finished) - self._history, 0)]:
+            del self._jobs[job.id]
+
+    def _run(self, job: Job) -> None:
+        self._local.job = job
+        job.status = "running"
+        job.started = time.time()
+        self._notify(job)
+        try:
+            job.func(*job.args)
+            job.status = "done"
+        except Exception as e:
+            logger.exception(f"job {job.kind} {job.id}: error")
+            job.status = "error"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            self._local.job = None
+            self._notify(job)
+            with self._lock:
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+                self._running[job.kind] -= 1
+                self._dispatch(job.kind)
+
+    def report_progress(self, done: int, total: int, what: str = "") -> None:
+        """ Progress of the job running on the calling thread, if any. """
+        job: Optional[Job] = getattr(self._local, "job", None)
+        if job is not None:
+            job.progress = { "done": done, "total": total, "what": what }
+            self._notify(job)
+
+    def get(self, jobid: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(jobid)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {
+            "queued": 0, "running": 0, "done": 0, "error": 0
+        }
+        for job in self.list():
+            counts[job.status] += 1
+        return counts
 
-    gstate.state = State.SERVICE_END
-    _write_state(gstate)
 
-    gstate.state = State.READY
-    _write_state(gstate)
+def _report_progress(done: int, total: int, what: str = "") -> None:
+    jobs: Optional[JobManager] = getattr(app.state, "jobs", None)
+    if jobs is not None:
+        jobs.report_progress(done, total, what)
+
+
+# -------------- workers --------------
+#
+# with several uvicorn workers, one of them is elected leader through a
+# lease in the shared database. The leader owns the state machine: it runs
+# every job and is the only one writing the state. The other workers follow
+# the state, serve the api, and pass the jobs they're asked for on to the
+# leader as commands in the shared database.
+#
+def _command_error(
+    gstate: GlobalState,
+    kind: str,
+    args: Dict[str, Any]
+) -> Optional[Tuple[int, str]]:
+    """ Why a command can't run in the current state, as an http error. """
+
+    if kind == "start":
+        if gstate.state != State.CHOOSE_OPERATION:
+            return (409, "already bootstrapping or bootstrapped")
+    elif kind == "provision":
+        if gstate.state != State.INVENTORY_WAIT:
+            return (409, "not waiting for a solution")
+        name: str = args.get("name", "")
+        if len(name) == 0 or _find_plan(gstate, name) is None:
+            return (400, "solution not provided or not recognized")
+    elif kind == "services":
+        if gstate.state != State.SERVICE_WAIT:
+            return (409, "not at service setup stage")
+        if len(ServiceDescriptorItem(**args).all_exports()) == 0:
+            return (400, "nfs names not provided")
+    else:
+        return (400, f"unknown command {kind}")
+    return None
 
-    pass
 
+def _command_job(
+    gstate: GlobalState,
+    kind: str,
+    args: Dict[str, Any]
+) -> Tuple[Callable, Tuple[Any, ...]]:
+    if kind == "start":
+        return do_start, (gstate,)
+    elif kind == "provision":
+        return do_select_solution, (gstate, args["name"])
+    assert kind == "services"
+    return do_services, (gstate, ServiceDescriptorItem(**args))
+
+
+class WorkerCoordinator:
+
+    def __init__(
+        self,
+        store: StateStore,
+        gstate: GlobalState,
+        executor: ThreadPoolExecutor,
+        on_elected: Callable[[], None],
+        ttl: float = LEADER_LEASE_TTL,
+        tick: float = WORKER_TICK
+    ) -> None:
+        self.store = store
+        self.gstate = gstate
+        self.holder = store.holder
+        self.leader: bool = False
+        self.jobs = JobManager(executor, listener=self._save_job)
+        self._on_elected = on_elected
+        self._ttl = ttl
+        self._tick = tick
+        self._renewed: float = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop, name="coordinator", daemon=True
+        )
 
-# run something in the background, synchronously.
+    def start(self) -> None:
+        # settle leadership before serving anything.
+        self.tick()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        if self.leader:
+            # let another worker take over right away.
+            with self.store.db.transaction() as db:
+                db.execute(
+                    "DELETE FROM lease WHERE name = ? AND holder = ?",
+                    (LEADER_LEASE, self.holder)
+                )
+            self.leader = False
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self._tick):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error("coordinator: " + str(e))
+                if self.leader and \
+                   time.monotonic() - self._renewed > self._ttl:
+                    self._demote()
+
+    def tick(self) -> None:
+        now: float = time.monotonic()
+        if self.leader:
+            if now - self._renewed >= self._ttl / 3:
+                if not self._acquire():
+                    self._demote()
+                    return
+                self._renewed = now
+            self._consume()
+        else:
+            self._sync()
+            if self._acquire():
+                self._renewed = now
+                self._elect()
+
+    def _acquire(self) -> bool:
+        """ Take or renew the leader lease, unless someone else holds it. """
+        with self.store.db.transaction() as db:
+            row = db.execute(
+                "SELECT holder, expires FROM lease WHERE name = ?",
+                (LEADER_LEASE,)
+            ).fetchone()
+            now: float = time.time()
+            if row is not None and row[0] != self.holder and row[1] > now:
+                return False
+            db.execute(
+                "INSERT OR REPLACE INTO lease (name, holder, expires) "
+                "VALUES (?, ?, ?)",
+                (LEADER_LEASE, self.holder, now + self._ttl)
+            )
+            return True
+
+    def _sync(self) -> None:
+        """ Follow the leader's state. """
+        if self.store.current_version() == self.store.version:
+            return
+        d: Optional[Dict[str, Any]] = self.store.load()
+        if d is not None:
+            self.gstate.load(d)
+
+    def _elect(self) -> None:
+        logger.info(f"worker {self.holder} is now the leader")
+        self._sync()
+        self.leader = True
+        # whatever the previous leader was running died with it.
+        for d in self.list_jobs():
+            if d["status"] in ["queued", "running"]:
+                d.update(status="error", error="leader went away")
+                self._put_job(d)
+        self._on_elected()
+
+    def _demote(self) -> None:
+        # jobs already running can't be stopped, but their state writes are
+        # fenced off by the lease from now on.
+        logger.error(f"worker {self.holder} lost leadership")
+        self.leader = False
+
+    def _consume(self) -> None:
+        """ Run the commands other workers queued. """
+        with self.store.db.transaction() as db:
+            rows = db.execute(
+                "SELECT id, kind, args FROM commands "
+                "WHERE claimed = 0 ORDER BY id"
+            ).fetchall()
+            db.execute("UPDATE commands SET claimed = 1 WHERE claimed = 0")
+
+        for cid, kind, args in rows:
+            job: Job = self.submit_local(kind, json.loads(args))
+            with self.store.db.transaction() as db:
+                db.execute(
+                    "UPDATE commands SET job = ? WHERE id = ?", (job.id, cid)
+                )
+                db.execute(
+                    "DELETE FROM commands WHERE claimed = 1 AND "
+                    "id <= (SELECT MAX(id) FROM commands) - ?",
+                    (JOB_HISTORY,)
+                )
+
+    def submit_local(self, kind: str, args: Dict[str, Any]) -> Job:
+        error: Optional[Tuple[int, str]] = \
+            _command_error(self.gstate, kind, args)
+        if error is not None:
+            return self.jobs.fail(kind, error[1])
+        func, func_args = _command_job(self.gstate, kind, args)
+        return self.jobs.submit(kind, func, *func_args)
+
+    def _push(self, kind: str, args: Dict[str, Any]) -> int:
+        with self.store.db.transaction() as db:
+            cur = db.execute(
+                "INSERT INTO commands (kind, args) VALUES (?, ?)",
+                (kind, json.dumps(args))
+            )
+            return cur.lastrowid
+
+    def _command_result(self, cid: int) -> Optional[Dict[str, Any]]:
+        row = self.store.db.get().execute(
+            "SELECT job FROM commands WHERE id = ?", (cid,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return self.get_job(row[0])
+
+    async def submit(self, kind: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        """ Run a command as a job on the leader; returns the job. """
+
+        if self.leader:
+            local: Job = \
+                await run_in_threadpool(self.submit_local, kind, args)
+            return local.dump()
+
+        cid: int = await run_in_threadpool(self._push, kind, args)
+        deadline: float = time.monotonic() + COMMAND_WAIT
+        while time.monotonic() < deadline:
+            job = await run_in_threadpool(self._command_result, cid)
+            if job is not None:
+                return job
+            await asyncio.sleep(self._tick / 5)
+        return { "id": None, "kind": kind, "status": "queued" }
+
+    def _put_job(self, d: Dict[str, Any]) -> None:
+        with self.store.db.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO jobs (id, submitted, data) "
+                "VALUES (?, ?, ?)",
+                (d["id"], d["submitted"], json.dumps(d))
+            )
+            db.execute(
+                "DELETE FROM jobs WHERE id NOT IN "
+                "(SELECT id FROM jobs ORDER BY submitted DESC LIMIT ?)",
+                (JOB_HISTORY,)
+            )
+
+    def _save_job(self, job: Job) -> None:
+        self._put_job(job.dump())
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        rows = self.store.db.get().execute(
+            "SELECT data FROM jobs ORDER BY submitted"
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_job(self, jobid: str) -> Optional[Dict[str, Any]]:
+        row = self.store.db.get().execute(
+            "SELECT data FROM jobs WHERE id = ?", (jobid,)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+
+# run a command as a job on the leader, whichever worker we are.
 #
-async def run_in_background(func: Callable, *args: Any) -> None:
-    loop = asyncio.get_event_loop()
-    loop.run_in_executor(app.state.executor, func, *args)
+async def run_command(kind: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    gstate: GlobalState = app.state.gstate
+    error: Optional[Tuple[int, str]] = _command_error(gstate, kind, args)
+    if error is not None:
+        logger.info(f"refusing {kind}: {error[1]}")
+        raise HTTPException(error[0], error[1])
+
+    coordinator: WorkerCoordinator = app.state.coordinator
+    return await coordinator.submit(kind, args)
 
 
 # --------- ON STARTUP / SHUTDOWN EVENTS ----------
@@ -623,34 +3299,147 @@ async def run_in_background(func: Callable, *args: Any) -> None:
 @app.on_event("startup")
 async def on_startup():
 
+    if not os.path.isdir(CONF_PATH):
+        os.mkdir(CONF_PATH)
+
     gstate = GlobalState()
+    holder: str = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
 
+    app.state.store = StateStore(CONF_PATH, holder)
     load_state(gstate)
 
-    if gstate.state == State.NONE:
-        gstate.state = State.CHOOSE_OPERATION
-        _write_state(gstate)
+    metrics = Metrics()
+    app.state.metrics = metrics
+    app.state.executor = ThreadPoolExecutor(
+        max_workers=JOB_WORKERS, thread_name_prefix="job"
+    )
+    app.state.gstate = gstate
+    app.state.dashboard = DashboardClient(
+        gstate, latency=metrics.dashboard_requests
+    )
+    app.state.dashboard_async = AsyncDashboardClient(app.state.dashboard)
+    app.state.ceph_shells = CephShellPool()
 
-    elif gstate.state == State.SERVICE_END:
-        gstate.state = State.READY
-        _write_state(gstate)
+    loop = asyncio.get_event_loop()
+    broker = EventBroker(loop)
+    broker.publish("status", { "status": gstate.state.name })
+    gstate.add_state_listener(
+        lambda state: broker.publish("status", { "status": state.name })
+    )
+    app.state.events = broker
 
-    app.state.executor = ThreadPoolExecutor()
-    app.state.gstate = gstate
+    def _on_elected() -> None:
+        if gstate.state == State.NONE:
+            gstate.state = State.CHOOSE_OPERATION
+            _write_state(gstate)
+
+        elif gstate.state == State.SERVICE_END:
+            gstate.state = State.READY
+            _write_state(gstate)
 
-    await run_in_background(restart_state, gstate)
+        history.load()
+        coordinator.jobs.submit("restart", restart_state, gstate)
+
+    coordinator = WorkerCoordinator(
+        app.state.store, gstate, app.state.executor, _on_elected
+    )
+    app.state.coordinator = coordinator
+    app.state.jobs = coordinator.jobs
+
+    # the leader polls the dashboard and shares its snapshots; every worker
+    # answers from the latest one.
+    poller = ClusterPoller(gstate, coordinator)
+    poller.add_listener(_publish_df_changes(broker))
+    app.state.poller = poller
+
+    # history is recorded by the leader alone, the others read what it shares.
+    history = UsageHistory(
+        os.path.join(CONF_PATH, "history.json"), app.state.store.db
+    )
+    poller.add_listener(
+        lambda snapshot: history.record(snapshot)
+        if coordinator.leader else None
+    )
+    app.state.history = history
+
+    def _start_poller_when_ready(state: State) -> None:
+        if state == State.READY:
+            loop.call_soon_threadsafe(poller.start)
+
+    gstate.add_state_listener(_start_poller_when_ready)
+    coordinator.start()
+    if gstate.state == State.READY:
+        poller.start()
+
+    metrics.gauge(
+        "rlyeh_state", "Current deployment state, as a state set.",
+        lambda: [
+            ((state.name,), 1.0 if state == gstate.state else 0.0)
+            for state in State
+        ],
+        ("state",)
+    )
+    metrics.gauge(
+        "rlyeh_leader", "Whether this worker is the leader.",
+        lambda: [((), 1.0 if coordinator.leader else 0.0)]
+    )
+    metrics.gauge(
+        "rlyeh_background_jobs", "Background jobs of this worker, by status.",
+        lambda: [
+            ((status,), float(count))
+            for status, count in app.state.jobs.counts().items()
+        ],
+        ("status",)
+    )
+    metrics.gauge(
+        "rlyeh_executor_backlog",
+        "Work items waiting for an executor thread.",
+        lambda: [
+            (("background",), _executor_backlog(app.state.executor)),
+            (("dashboard",),
+             _executor_backlog(app.state.dashboard_async._executor))
+        ],
+        ("executor",)
+    )
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    coordinator: WorkerCoordinator = app.state.coordinator
+    app.state.poller.stop()
     app.state.executor.shutdown()
+    app.state.ceph_shells.close()
+    if coordinator.leader:
+        app.state.history.save()
+    app.state.store.close()
+    coordinator.stop()
+    app.state.dashboard_async.close()
+    app.state.dashboard.close()
 
 
 def restart_state(gstate: GlobalState):
+    """ Resume whatever phase we were in, from its last completed step. """
+
+    state: State = gstate.state
+
+    if state == State.BOOTSTRAP_START:
+        # a half-done bootstrap can't be picked up again.
+        gstate.state = State.BOOTSTRAP_ERROR
+        _write_state(gstate)
+
+    elif state in [State.BOOTSTRAP_END, State.AUTH_START, State.AUTH_END,
+                   State.INVENTORY_START, State.INVENTORY_WAIT]:
+        do_start(gstate)
 
-    if gstate.state == State.INVENTORY_WAIT or \
-       gstate.state == State.AUTH_END:
-        do_obtain_inventory(gstate)
+    elif state in [State.INVENTORY_END, State.PROVISION_START] and \
+            len(gstate.plan) > 0:
+        do_provision(gstate, gstate.plan["replicas"])
+
+    elif state == State.PROVISION_END:
+        _service_prepare(gstate)
+
+    elif state == State.SERVICE_START and len(gstate.services) > 0:
+        do_services(gstate, ServiceDescriptorItem(**gstate.services))
 
 
 # -------- API Calls ----------
@@ -663,24 +3452,101 @@ async def get_status():
     gstate = app.state.gstate
     state: State = gstate.state
     state_name: str = state.name
+    store: StateStore = app.state.store
 
-    return { "status": state_name }
+    return { "status": state_name, "version": store.version }
 
 
+@api.get("/events")
+async def get_events(request: Request):
+
+    broker: EventBroker = app.state.events
+
+    last_id: Optional[str] = request.headers.get("last-event-id")
+
+    async def stream():
+        queue, missed = broker.subscribe(last_id)
+        try:
+            yield f"retry: {EVENT_RETRY}\n\n"
+            for event in missed:
+                yield _format_event(broker, event)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), EVENT_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                yield _format_event(broker, event)
+        finally:
+            broker.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={ "Cache-Control": "no-cache", "X-Accel-Buffering": "no" }
+    )
 
-@api.post("/bootstrap")
-async def bootstrap():
+
+@api.get("/steps")
+async def get_steps():
 
     gstate: GlobalState = app.state.gstate
+    return _step_timeline(gstate)
 
-    if gstate.state != State.CHOOSE_OPERATION:
-        logger.info("bootstrap already going or finished")
-        raise HTTPException(409, "already bootstrapping or bootstrapped")
 
-    logger.info("start bootstrapping")
-    await run_in_background(do_start, gstate)
+@api.get("/jobs")
+async def get_jobs():
+
+    coordinator: WorkerCoordinator = app.state.coordinator
+    return await run_in_threadpool(coordinator.list_jobs)
+
+
+@api.get("/jobs/{jobid}")
+async def get_job(jobid: str):
+
+    coordinator: WorkerCoordinator = app.state.coordinator
+    job: Optional[Dict[str, Any]] = \
+        await run_in_threadpool(coordinator.get_job, jobid)
+    if job is None:
+        raise HTTPException(404, "unknown job")
+    return job
+
+
+@api.get("/poller")
+async def get_poller():
+
+    poller: ClusterPoller = app.state.poller
+    return poller.status()
+
+
+@api.get("/dashboard/pool")
+async def get_dashboard_pool():
+
+    client: DashboardClient = app.state.dashboard
+    return client.pool_stats()
 
 
+@api.get("/metrics")
+async def get_metrics():
+
+    metrics: Metrics = app.state.metrics
+    return Response(
+        content=metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@api.post("/bootstrap")
+async def bootstrap():
+
+    logger.info("start bootstrapping")
+    return await run_command("start", {})
+
 
 @api.get("/inventory")
 async def get_inventory():
@@ -693,30 +3559,15 @@ async def get_inventory():
 @api.post("/solution/accept")
 async def accept_solution(solution: SolutionAcceptItem):
 
-    gstate: GlobalState = app.state.gstate
     logger.info("handle solution accept: " + solution.name)
-    if len(solution.name) == 0 or \
-       (solution.name != "raid0" and solution.name != "raid1"):
-        raise HTTPException(400, "solution not provided or not recognized")
-
-    await run_in_background(do_select_solution, gstate, solution.name)
-    return 0
+    return await run_command("provision", solution.dict())
 
 
 @api.post("/services/setup")
 async def setup_services(descriptor: ServiceDescriptorItem):
 
-    gstate: GlobalState = app.state.gstate
-
-    if gstate.state != State.SERVICE_WAIT:
-        logger.info("not at service setup stage")
-        raise HTTPException(409, "not at service setup stage")
-
-    logger.info("handle services setup: " + str(descriptor.nfs_name))
-    if len(descriptor.nfs_name) == 0:
-        raise HTTPException(400, "nfs names not provided")
-
-    await run_in_background(do_services, gstate, descriptor)
+    logger.info("handle services setup: " + str(descriptor.all_exports()))
+    return await run_command("services", descriptor.dict())
 
 
 @api.get("/services/nfs")
@@ -727,7 +3578,9 @@ async def get_services_nfs():
         logger.info("not at ready stage, can't provide service info")
         raise HTTPException(409, "not ready")
 
-    raw_nfs = _get(gstate, "nfs-ganesha/export", {})
+    poller: ClusterPoller = app.state.poller
+    snapshot: ClusterSnapshot = await poller.get()
+    raw_nfs = snapshot.exports
     assert len(raw_nfs) > 0
     exports: List[ServiceNFSItem] = []
 
@@ -743,46 +3596,193 @@ async def get_services_nfs():
 
 
 @api.get("/df", response_model=StatsItem)
-async def get_df() -> StatsItem:
+async def get_df(request: Request) -> Response:
     gstate: GlobalState = app.state.gstate
 
     if gstate.state != State.READY:
         raise HTTPException(412, "server not ready")
 
-    nfs = _get(gstate, "nfs-ganesha/export", {})
-    
-    nfs_poolname_to_clusterid = {}
-    cephfs_pools = []
-    for export in nfs:
-        fsname = export["fsal"]["fs_name"]
-        poolname = f"cephfs.{fsname}.data"
-        cephfs_pools.append(poolname)
-        nfs_poolname_to_clusterid[poolname] = export["cluster_id"]
-    
-    pools = _get(gstate, "pool", {"stats": True})
+    poller: ClusterPoller = app.state.poller
+    snapshot: ClusterSnapshot = await poller.get()
+    stats: StatsItem = snapshot.stats
+    etag: str = snapshot.etag
+    headers: Dict[str, str] = {
+        "ETag": etag,
+        "Cache-Control": "no-cache"
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
 
-    nfs_pools = {}
-    for pool in pools:
-        poolname = pool["pool_name"]
-        if cephfs_pools.count(poolname) > 0:
-            clusterid = nfs_poolname_to_clusterid[poolname]
-            nfs_pools[clusterid] = {
-                "used": pool["stats"]["bytes_used"]["latest"],
-                "percent_used": pool["stats"]["percent_used"]["latest"],
-                "avail": pool["stats"]["max_avail"]["latest"],
-                "avail_raw": pool["stats"]["avail_raw"]["latest"]
-            }
+    return JSONResponse(content=stats.dict(), headers=headers)
 
-    health = _get(gstate, "health/minimal", {})
-    df = health["df"]["stats"]
-    stats: StatsItem = StatsItem(
-        total_avail_bytes=df["total_avail_bytes"],
-        total_raw_bytes=df["total_bytes"],
-        total_used_raw_bytes=df["total_used_raw_bytes"],
-        pools=nfs_pools
-    )
 
-    return stats
+@api.get("/df/history", response_model=UsageHistoryItem)
+async def get_df_history(
+    series: str = "total",
+    resolution: Optional[int] = None,
+    points: int = 120
+) -> UsageHistoryItem:
+
+    history: UsageHistory = app.state.history
+    coordinator: WorkerCoordinator = app.state.coordinator
+    item: Optional[UsageHistoryItem]
+    if coordinator.leader:
+        item = history.query(series, resolution, points)
+    else:
+        item = await run_in_threadpool(
+            history.query_shared, series, resolution, points
+        )
+    if item is None:
+        raise HTTPException(404, "unknown series or resolution")
+    return item
+
+
+# -------------- frontend assets --------------
+#
+# the frontend is built with hashed file names (see mkdist.sh), so those can
+# be cached by browsers forever; everything else is revalidated by etag.
+# mkdist.sh also leaves .br and .gz siblings next to each file, which are
+# served as-is to clients that accept them.
+#
+class StaticAsset(NamedTuple):
+    body: bytes
+    etag: str
+    media_type: str
+    encoding: Optional[str]
+    stamp: Tuple[float, int]    # mtime, size of the file served
+
+
+class StaticAssets:
+    """ ASGI app serving the built frontend, with hot files in memory. """
+
+    def __init__(
+        self,
+        directory: str,
+        cache_bytes: int = STATIC_CACHE_BYTES,
+        max_file: int = STATIC_CACHE_MAX_FILE
+    ) -> None:
+        self.directory = os.path.realpath(directory)
+        self.cache_bytes = cache_bytes
+        self.max_file = max_file
+        self._cache: "OrderedDict[str, StaticAsset]" = OrderedDict()
+        self._cached_bytes: int = 0
+        self._lock = threading.Lock()
+
+    def _resolve(self, path: str) -> Optional[str]:
+        """ File on disk for a request path, None if outside or missing. """
+        relpath: str = path.lstrip("/")
+        full: str = os.path.realpath(os.path.join(self.directory, relpath))
+        if full != self.directory and \
+           not full.startswith(self.directory + os.sep):
+            return None
+        if os.path.isdir(full):
+            full = os.path.join(full, "index.html")
+        return full if os.path.isfile(full) else None
+
+    def _load(self, path: str, encoding: Optional[str]) -> StaticAsset:
+        """ Read 'path', or its 'encoding' variant; blocking. """
+        suffix: str = dict(STATIC_ENCODINGS).get(encoding or "", "")
+        filename: str = path + suffix
+        st = os.stat(filename)
+        with open(filename, "rb") as fd:
+            body: bytes = fd.read()
+        media_type: str = \
+            mimetypes.guess_type(path)[0] or "application/octet-stream"
+        digest: str = hashlib.sha1(body).hexdigest()[:16]
+        return StaticAsset(
+            body=body,
+            etag=f'"{digest}"',
+            media_type=media_type,
+            encoding=encoding,
+            stamp=(st.st_mtime, st.st_size)
+        )
+
+    def _get_cached(self, key: str, check: bool) -> Optional[StaticAsset]:
+        with self._lock:
+            asset: Optional[StaticAsset] = self._cache.get(key)
+            if asset is None:
+                return None
+            self._cache.move_to_end(key)
+        if check:
+            # not immutable; make sure the file didn't change under us.
+            suffix: str = dict(STATIC_ENCODINGS).get(asset.encoding or "", "")
+            try:
+                st = os.stat(key.split("|")[0] + suffix)
+            except OSError:
+                return None
+            if (st.st_mtime, st.st_size) != asset.stamp:
+                return None
+        return asset
+
+    def _put_cached(self, key: str, asset: StaticAsset) -> None:
+        if len(asset.body) > self.max_file:
+            return
+        with self._lock:
+            old: Optional[StaticAsset] = self._cache.pop(key, None)
+            if old is not None:
+                self._cached_bytes -= len(old.body)
+            self._cache[key] = asset
+            self._cached_bytes += len(asset.body)
+            while self._cached_bytes > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted.body)
+
+    def _negotiate(self, path: str, accept: str) -> Optional[str]:
+        accepted: List[str] = [
+            token.split(";")[0].strip() for token in accept.split(",")
+            if not re.search(r";\s*q=0(\.0*)?\s*$", token)
+        ]
+        for encoding, suffix in STATIC_ENCODINGS:
+            if encoding in accepted and os.path.isfile(path + suffix):
+                return encoding
+        return None
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        assert scope["type"] == "http"
+        request = Request(scope)
+
+        response: Response
+        if request.method not in ["GET", "HEAD"]:
+            response = Response("Method Not Allowed", status_code=405)
+            await response(scope, receive, send)
+            return
+
+        path: Optional[str] = self._resolve(scope["path"])
+        if path is None:
+            response = Response("Not Found", status_code=404)
+            await response(scope, receive, send)
+            return
+
+        immutable: bool = \
+            STATIC_HASHED.search(os.path.basename(path)) is not None
+        encoding: Optional[str] = self._negotiate(
+            path, request.headers.get("accept-encoding", "")
+        )
+        key: str = f"{path}|{encoding or ''}"
+        asset: Optional[StaticAsset] = self._get_cached(key, not immutable)
+        if asset is None:
+            asset = await run_in_threadpool(self._load, path, encoding)
+            self._put_cached(key, asset)
+
+        headers: Dict[str, str] = {
+            "ETag": asset.etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": "public, max-age=31536000, immutable"
+            if immutable else "no-cache"
+        }
+        if asset.encoding is not None:
+            headers["Content-Encoding"] = asset.encoding
+
+        if request.headers.get("if-none-match") == asset.etag:
+            response = Response(status_code=304, headers=headers)
+        elif request.method == "HEAD":
+            headers["Content-Length"] = str(len(asset.body))
+            response = Response(headers=headers, media_type=asset.media_type)
+        else:
+            response = Response(
+                asset.body, headers=headers, media_type=asset.media_type
+            )
+        await response(scope, receive, send)
 
 
 app.mount(
@@ -792,7 +3792,7 @@ app.mount(
 )
 app.mount(
     "/",
-    StaticFiles(directory="frontend/dist/cthulhu", html=True),
+    StaticAssets(STATIC_DIR),
     name="static"
 )
 
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# rlyeh keeps its state under CONF_PATH, set when the module is imported.
+os.environ.setdefault("RLYEH_CONF_PATH", tempfile.mkdtemp(prefix="rlyeh-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
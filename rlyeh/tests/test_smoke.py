@@ -0,0 +1,344 @@
+import argparse
+import logging
+import os
+import ssl
+import sys
+import threading
+import types
+
+import rlyeh
+from cephadm import cephadm
+
+
+def test_ceph_shell_from_template() -> None:
+    ctx = cephadm.CephadmContext()
+    ctx.args = argparse.Namespace()
+    ctx.container_path = "/usr/bin/podman"
+    template = cephadm.CephContainer(
+        ctx,
+        image="ceph/ceph",
+        entrypoint="ceph",
+        args=["-s"],
+        cname="ceph-shell"
+    )
+
+    shell = rlyeh.CephShell(ctx, template, 3)
+
+    assert shell.name == "rlyeh-ceph-shell-3"
+    cmd = shell._container.run_cmd()
+    assert "--name" in cmd and "rlyeh-ceph-shell-3" in cmd
+    assert cmd[-1] == "infinity"
+    # the pool's template is shared by every shell, leave it alone.
+    assert template.cname == "ceph-shell"
+    assert template.args == ["-s"]
+
+
+def test_state_store_retries_failed_write(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(rlyeh, "STATE_FLUSH_RETRY", 0.01)
+    store = rlyeh.StateStore(str(tmp_path), "me", flush_delay=0.01)
+    with store.db.transaction() as db:
+        db.execute("INSERT OR REPLACE INTO lease (name, holder, expires) "
+                   "VALUES (?, ?, ?)", (rlyeh.LEADER_LEASE, "me", 2 ** 40))
+
+    transaction = store.db.transaction
+    failures = [Exception("database is locked")]
+
+    def flaky():
+        if failures:
+            raise failures.pop()
+        return transaction()
+
+    monkeypatch.setattr(store.db, "transaction", flaky)
+    version = store.update({"state": 1})
+    for _ in range(200):
+        if store.current_version() == version:
+            break
+        rlyeh.time.sleep(0.01)
+    assert store.current_version() == version
+    assert store._flusher.is_alive()
+    store.close()
+
+
+class FakeShells:
+    def __init__(self, replies) -> None:
+        self.replies = replies
+        self.cmds = []
+
+    def run(self, cmd):
+        self.cmds.append(cmd)
+        return rlyeh.CephShellResult(self.replies.get(cmd, ""), "", 0)
+
+
+def test_nvme_osds_join_the_ssd_class(monkeypatch) -> None:
+    shells = FakeShells({
+        "osd crush class ls --format json": '["hdd", "nvme"]',
+        "osd crush class ls-osd nvme --format json": "[3, 4]",
+    })
+    monkeypatch.setattr(rlyeh.app.state, "ceph_shells", shells, raising=False)
+
+    rlyeh._fold_flash_classes()
+
+    assert shells.cmds[2:] == [
+        "osd crush rm-device-class osd.3 osd.4",
+        "osd crush set-device-class ssd osd.3 osd.4",
+    ]
+
+
+def test_single_host_pools_replicate_across_osds(monkeypatch) -> None:
+    shells = FakeShells({
+        f"osd crush rule dump {rlyeh.OSD_CRUSH_RULE} --format json":
+            '{"rule_id": 1}',
+        "osd pool ls --format json": '["device_health_metrics"]',
+    })
+    monkeypatch.setattr(rlyeh.app.state, "ceph_shells", shells, raising=False)
+    applied = {}
+
+    def apply_config(gstate, options):
+        applied.update(options)
+        return {name: "applied" for name in options}
+
+    monkeypatch.setattr(rlyeh, "_apply_config", apply_config)
+    gstate = rlyeh.GlobalState()
+    gstate.plan = {"failure_domain": "osd"}
+
+    rlyeh._setup_config(gstate, 2)
+
+    assert applied["osd_pool_default_crush_rule"] == 1
+    assert "osd pool set device_health_metrics crush_rule " \
+        f"{rlyeh.OSD_CRUSH_RULE}" in shells.cmds
+
+
+def test_followers_read_shared_usage_history(tmp_path, monkeypatch) -> None:
+    executor = rlyeh.ThreadPoolExecutor(1)
+    monkeypatch.setattr(rlyeh.app.state, "executor", executor, raising=False)
+    db = rlyeh.SharedDB(str(tmp_path / "rlyeh.db"))
+    leader = rlyeh.UsageHistory(str(tmp_path / "history.json"), db)
+    follower = rlyeh.UsageHistory(str(tmp_path / "history.json"), db)
+    stamp = rlyeh.time.time()
+
+    async def record() -> None:
+        for n in range(3):
+            leader.record(rlyeh.ClusterSnapshot(
+                stamp=stamp + n * 10, exports=(), pools=(), health={},
+                stats=rlyeh.StatsItem(
+                    total_avail_bytes=1000 - n, total_raw_bytes=1100,
+                    total_used_raw_bytes=100 + n, pools={}
+                ),
+                etag=""
+            ))
+
+    rlyeh.asyncio.run(record())
+    executor.shutdown(wait=True)
+
+    assert len(leader.query("total", None, 120).points) == 3
+    assert follower.query_shared("total", None, 120) == \
+        leader.query("total", None, 120)
+    assert follower.query_shared("total", 7, 120) is None
+    assert follower.query_shared("nope", None, 120) is None
+
+
+def test_failed_step_fails_the_job(monkeypatch) -> None:
+    monkeypatch.setattr(rlyeh.app.state, "metrics", rlyeh.Metrics(),
+                        raising=False)
+    monkeypatch.setattr(rlyeh, "_write_state", lambda gstate: None)
+
+    def broken(gstate) -> None:
+        raise Exception("no luck")
+
+    jobs = rlyeh.JobManager(rlyeh.ThreadPoolExecutor(1))
+    job = jobs.submit("provision", rlyeh.run_steps, rlyeh.GlobalState(), [
+        rlyeh.Step("first", broken),
+        rlyeh.Step("second", lambda g: None, ("first",)),
+    ])
+    for _ in range(200):
+        if job.status not in ("queued", "running"):
+            break
+        rlyeh.time.sleep(0.01)
+
+    assert job.status == "error"
+    assert job.error == "no luck"
+
+
+def test_ceph_shell_keeps_quoted_arguments(monkeypatch) -> None:
+    pool = rlyeh.CephShellPool()
+    ran = []
+
+    class Shell:
+        def run(self, args, timeout):
+            ran.append(args)
+            return rlyeh.CephShellResult("", "", 0)
+
+    monkeypatch.setattr(pool, "_acquire", lambda: Shell())
+    monkeypatch.setattr(pool, "_release", lambda shell: None)
+
+    pool.run("nfs export create cephfs vol vol-nfs '/my share' "
+             "'--path=/a dir'")
+
+    assert ran == [["nfs", "export", "create", "cephfs", "vol", "vol-nfs",
+                    "/my share", "--path=/a dir"]]
+
+
+def test_drained_ceph_shells_are_stopped(monkeypatch) -> None:
+    pool = rlyeh.CephShellPool(size=2)
+    stopped = []
+
+    class Shell:
+        slot = 0
+
+        def stop(self) -> None:
+            stopped.append(self)
+
+    shell = Shell()
+    pool._idle.append(shell)
+    pool._free_slots.remove(0)
+
+    pool.drain()
+
+    assert stopped == [shell]
+    assert sorted(pool._free_slots) == [0, 1]
+    assert not pool._closed
+
+
+def test_apply_config_against_stub_dashboard(tmp_path, monkeypatch) -> None:
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "misc", "bench"
+    ))
+    import stub_dashboard
+
+    server = stub_dashboard.StubServer(
+        ("127.0.0.1", 0), stub_dashboard.Dashboard(1, 4, 0),
+        0.0, 0.0, 0.0, 3600.0, False
+    )
+    cert, key = stub_dashboard._self_signed(str(tmp_path))
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    gstate = rlyeh.GlobalState()
+    gstate.host = "127.0.0.1"
+    gstate.port = server.server_port
+    monkeypatch.setattr(rlyeh.app.state, "dashboard",
+                        rlyeh.DashboardClient(gstate), raising=False)
+    try:
+        options = {"mon_allow_pool_size_one": True, "osd_pool_default_size": 2}
+        assert rlyeh._apply_config(gstate, options) == {
+            "mon_allow_pool_size_one": "applied",
+            "osd_pool_default_size": "applied"
+        }
+        assert rlyeh._apply_config(gstate, options) == {
+            "mon_allow_pool_size_one": "unchanged",
+            "osd_pool_default_size": "unchanged"
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_call_many_falls_back_to_call(monkeypatch) -> None:
+    # python < 3.8 can't start processes from the engine's loop thread
+    monkeypatch.setattr(cephadm, "CONCURRENT_CALLS", False)
+    monkeypatch.setattr(cephadm.call_engine, "gather", None)
+    monkeypatch.setattr(cephadm, "logger", logging.getLogger("cephadm"))
+    ctx = cephadm.CephadmContext()
+    ctx.args = argparse.Namespace(timeout=10)
+
+    results = cephadm.call_many(ctx, [["echo", "a"], ["sh", "-c", "exit 3"]])
+
+    assert [(out.strip(), code) for out, _, code in results] == \
+        [("a", 0), ("", 3)]
+
+
+def test_jobs_notify_without_the_lock() -> None:
+    class Deferred:
+        def __init__(self) -> None:
+            self.calls = []
+
+        def submit(self, func, *args) -> None:
+            self.calls.append((func, args))
+
+    held = []
+    executor = Deferred()
+    jobs = rlyeh.JobManager(executor, listener=lambda job: held.append(
+        (job.status, jobs._lock.locked())
+    ))
+    job = jobs.submit("noop", lambda: None)
+    for func, args in executor.calls:
+        func(*args)
+
+    assert job.status == "done"
+    assert held == [("queued", False), ("running", False), ("done", False)]
+
+
+def test_followers_serve_the_leaders_snapshot(tmp_path, monkeypatch) -> None:
+    db = rlyeh.SharedDB(str(tmp_path / "rlyeh.db"))
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO lease (name, holder, expires) "
+                     "VALUES (?, ?, ?)", (rlyeh.LEADER_LEASE, "a", 2 ** 40))
+    store = types.SimpleNamespace(db=db)
+    replies = {
+        "nfs-ganesha/export": [
+            {"cluster_id": "share-nfs", "fsal": {"fs_name": "share"}}
+        ],
+        "pool": [{
+            "pool_name": "cephfs.share.data",
+            "stats": {
+                "bytes_used": {"latest": 1}, "percent_used": {"latest": 0.1},
+                "max_avail": {"latest": 9}, "avail_raw": {"latest": 18}
+            }
+        }],
+        "health/minimal": {"df": {"stats": {
+            "total_avail_bytes": 90, "total_bytes": 100,
+            "total_used_raw_bytes": 10
+        }}}
+    }
+
+    async def aget(gstate, endpoint, params):
+        return replies[endpoint]
+
+    monkeypatch.setattr(rlyeh, "_aget", aget)
+
+    async def poll():
+        leading = types.SimpleNamespace(leader=True, holder="a", store=store)
+        following = types.SimpleNamespace(leader=False, holder="b",
+                                          store=store)
+        leader = rlyeh.ClusterPoller(rlyeh.GlobalState(), leading)
+        follower = rlyeh.ClusterPoller(rlyeh.GlobalState(), following)
+        seen = []
+        follower.add_listener(seen.append)
+
+        await follower.follow()
+        assert follower.snapshot is None
+        await leader.refresh()
+        await follower.follow()
+        await follower.follow()
+        return leader.snapshot, seen
+
+    snapshot, seen = rlyeh.asyncio.run(poll())
+
+    assert len(seen) == 1
+    assert seen[0] == snapshot
+    assert seen[0].stats.pools["share-nfs"].avail == 9
+
+
+def test_event_ids_from_another_worker_get_full_state() -> None:
+    async def run():
+        loop = rlyeh.asyncio.get_running_loop()
+        ours, theirs = rlyeh.EventBroker(loop), rlyeh.EventBroker(loop)
+        for broker in [ours, theirs]:
+            broker._dispatch("status", '"READY"')
+            broker._dispatch("df", "1")
+            broker._dispatch("df", "2")
+
+        _, missed = ours.subscribe(ours.event_id(ours._backlog[1]))
+        assert [ev.data for ev in missed] == ["2"]
+
+        _, missed = ours.subscribe(theirs.event_id(theirs._backlog[1]))
+        assert [(ev.kind, ev.data) for ev in missed] == \
+            [("status", '"READY"'), ("df", "2")]
+
+        _, missed = ours.subscribe("7")
+        assert len(missed) == 2
+
+    rlyeh.asyncio.run(run())